@@ -11,10 +11,13 @@ except (AssertionError, ImportError) as ex:
 
     webbrowser.open("https://bl-sdk.github.io/willow2-mod-db/requirements?mod=DamageMeter")
     raise ex
-from copy import deepcopy
-from typing import TYPE_CHECKING, TypedDict, cast
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Mapping, TypedDict, cast
 from unrealsdk import find_enum
 from unrealsdk.hooks import Type
+from unrealsdk.unreal import WeakPointer
 from coroutines.loop import TickCoroutine, start_coroutine_tick
 from coroutines import (
     PostRenderCoroutine,
@@ -25,28 +28,48 @@ from coroutines import (
 from mods_base import ENGINE, build_mod, get_pc, hook, options
 from mods_base.keybinds import keybind
 from mods_base.mod import CoopSupport, Game
-from networking.decorators import targeted
+from mods_base.settings import SETTINGS_DIR
+from networking.decorators import host, targeted
 from networking.factory import add_network_functions
 from ui_utils.hud_message import show_hud_message
+from .combat_log import KIND_HIT, KIND_TAKEN, CombatLog
+from .columns import DPS_WINDOWS, HIT_QUANTILES, human_format
+from .dps import RollingDps
+from .encounters import EncounterHistory
+from .enemies import BOSS_MIN_TIME_TO_KILL, MAX_TRACKED_ENEMIES, EnemyTable
+from .hits import HitBuffer
+from .interpolation import StatsInterpolator
 from .meter_options import (
     MeterOptions,
     RHS_COLUMNS,
     ColorBy,
-    ColumnType,
     opt_color_by,
     opt_show_bars,
     opt_show_class,
+    opt_show_graph,
 )
+from .persistence import WRITE_INTERVAL, StatsJournal
+from .render_model import RenderModel, RenderModelCache, build_render_model
+from .scheduler import SyncScheduler
+from .share import SendResult, receive_from_host, send_to_clients
+from .snapshot import EMPTY_SNAPSHOT, PlayerStats, StatsSnapshot
+from .sparkline import DpsSeries
+from .store import PlayerRecord, StatsStore
+from .sync import StatsMessage, SyncClient, SyncHost
 
 if TYPE_CHECKING:
     from bl2 import (
+        Actor,
         Canvas,
         GameEngine,
+        GameInfo,
         Object,
+        PlayerReplicationInfo,
         WillowGameEngine,
         WillowGameViewportClient,
         WillowPawn,
         WillowPlayerController,
+        WillowWeapon,
         WorldInfo,
     )
     from ui import drawing
@@ -64,14 +87,6 @@ class CharacterAttributes(TypedDict):
     display_name: str
 
 
-class PlayerStats(TypedDict):
-    number: int
-    character_class: str
-    damage: int
-    dps: float
-    start_epoch: float
-
-
 ATTRIBUTES: dict[str, CharacterAttributes] = {
     "Axton": {"color": drawing.AXTON_GREEN_COLOR, "display_name": "Axton"},
     "Maya": {"color": drawing.MAYA_YELLOW_COLOR, "display_name": "Maya"},
@@ -80,6 +95,9 @@ ATTRIBUTES: dict[str, CharacterAttributes] = {
     "Gaige": {"color": drawing.GAIGE_PURPLE_COLOR, "display_name": "Gaige"},
     "Krieg": {"color": drawing.KRIEG_RED_COLOR, "display_name": "Krieg"},
 }
+CLASS_DISPLAY_NAMES = {
+    character_class: attributes["display_name"] for character_class, attributes in ATTRIBUTES.items()
+}
 
 PLAYER_COLORS = [
     drawing.ZERO_CYAN_COLOR,
@@ -92,13 +110,22 @@ PLAYER_COLORS = [
 
 TITLE = "Damage Meter"
 
+SOURCE_NAME_CACHE_SIZE = 64
+COMBAT_LOG_PATH: Path = SETTINGS_DIR / "DamageMeter" / "combat_logs"
+PERSISTED_STATS_PATH: Path = SETTINGS_DIR / "DamageMeter" / "stats"
+SHOWN_SOURCES = 3
+
+# height of the dps graph in lines and how many pixels of the meter width one point of it gets at least
+GRAPH_LINES = 3
+GRAPH_PIXELS_PER_POINT = 4
+
 # endregion
 # region Options
 
 
 def on_default_active_change(_, value: bool) -> None:
     if value and DamageMeterState.is_hidden:
-        DamageMeterState.is_hidden = False
+        set_hidden(False)
         DamageMeterState.is_paused = False
 
 
@@ -132,18 +159,93 @@ opt_share_per_five = options.SliderOption(
     step=100,
     description="How often the data should be shared with clients. Lower values can lead to performance problems for the other clients. Default is 1000 ms = 1 second.",
 )
+
+opt_adaptive_share_interval = options.BoolOption(
+    identifier="Adaptive Share Interval",
+    value=True,
+    description="Whether to share data with clients quickly while the stats change and less often while they don't, within the upload budget. Replaces the fixed share data interval.",
+)
+
+opt_share_upload_budget = options.SliderOption(
+    identifier="Share Upload Budget in KB/s",
+    value=32,
+    min_value=4,
+    max_value=256,
+    step=4,
+    description="How much data the adaptive share interval may send to all clients together per second. Default is 32 KB/s.",
+)
+
+opt_smooth_client_values = options.BoolOption(
+    identifier="Smooth Values as Client",
+    value=True,
+    description="Whether clients should smoothly move the damage and DPS values between the updates from the host instead of jumping once per update.",
+)
+
+
+opt_split_encounters = options.BoolOption(
+    identifier="Split Encounters",
+    value=True,
+    description="Whether to automatically start a new encounter after nobody dealt damage for a while. Finished encounters can be paged through with the Previous/Next Encounter keybinds.",
+)
+
+opt_split_on_long_kills = options.BoolOption(
+    identifier="Split Encounters on Long Kills",
+    value=False,
+    description=f"Whether to also start a new encounter after an enemy died that took at least {BOSS_MIN_TIME_TO_KILL:.0f} seconds to kill, e.g. a boss. Tanky enemies in a normal fight count as well, which is why this is off by default.",
+)
+
+opt_encounter_timeout = options.SliderOption(
+    identifier="Encounter Timeout in s",
+    value=15,
+    min_value=3,
+    max_value=120,
+    description="How long nobody has to deal damage for the next damage to start a new encounter. Default is 15 seconds.",
+)
+
+
+def on_record_combat_log_change(_, value: bool) -> None:
+    if not value:
+        stop_combat_log()
+
+
+opt_record_combat_log = options.BoolOption(
+    identifier="Record Combat Log",
+    value=False,
+    description=f"Whether to write every hit into a binary log in {COMBAT_LOG_PATH}, e.g. for analysing it later. Finished log files get compressed and a new one is started every 64 MB.",
+    on_change=on_record_combat_log_change,
+)
+
+
+def on_keep_stats_change(_, value: bool) -> None:
+    if not value:
+        close_stats_journal(clear=True)
+
+
+opt_keep_stats = options.BoolOption(
+    identifier="Keep Stats on Reload",
+    value=False,
+    description=f"Whether to keep the stats of the current encounter when the map gets reloaded or the game crashes. The stats get saved once a second in {PERSISTED_STATS_PATH}.",
+    on_change=on_keep_stats_change,
+)
+
+opt_compact_network_format = options.BoolOption(
+    identifier="Compact Network Format",
+    value=True,
+    description="Whether to send the stats to clients in a compact binary format instead of JSON. Uses less bandwidth and is faster to read for clients.",
+)
 # endregion
 # region Keybinds
 
 
 def reset_damage_meter() -> None:
-    for player in DamageMeterState.player_stats:
-        DamageMeterState.player_stats[player].update(damage=0, dps=0)
+    # the current encounter is kept in the history, so include the hits that are still buffered
+    drain_hits()
+    finish_encounter()
 
 
 @keybind("Enable/Disable Meter", key="F10")
 def start_meter() -> None:
-    DamageMeterState.is_hidden = not DamageMeterState.is_hidden
+    set_hidden(not DamageMeterState.is_hidden)
     if is_client():
         return
     reset_damage_meter()
@@ -166,15 +268,18 @@ def pause_meter() -> None:
     # first add back time that passed during the pause,
     # then "oficially" unpause to make sure the coroutine definetly uses the correct time
     if current_state.is_paused:
-        for player in current_state.player_stats:
+        for record in current_state.store:
+            record.rolling_dps.shift(get_current_epoch() - current_state.pause_start_epoch)
 
             # players that joined after the pause started need to be handled separately
-            if current_state.player_stats[player]["start_epoch"] > current_state.pause_start_epoch:
-                current_state.player_stats[player]["start_epoch"] = get_current_epoch()
+            if record.start_epoch > current_state.pause_start_epoch:
+                record.start_epoch = get_current_epoch()
             else:
-                current_state.player_stats[player]["start_epoch"] += (
-                    get_current_epoch() - current_state.pause_start_epoch
-                )
+                record.start_epoch += get_current_epoch() - current_state.pause_start_epoch
+            current_state.store.mark_dirty(record)
+        current_state.encounter_start_epoch += get_current_epoch() - current_state.pause_start_epoch
+        current_state.last_damage_epoch += get_current_epoch() - current_state.pause_start_epoch
+        publish_stats()
     else:
         current_state.pause_start_epoch = get_current_epoch()
 
@@ -182,6 +287,78 @@ def pause_meter() -> None:
     show_hud_message(TITLE, "Damage tracking " + ("paused" if current_state.is_paused else "resumed"))
 
 
+def show_encounter(encounters_back: int) -> None:
+    history = DamageMeterState.history
+    DamageMeterState.viewed_encounter = max(0, min(encounters_back, len(history)))
+    summary = history.get(DamageMeterState.viewed_encounter)
+    show_hud_message(TITLE, "Current encounter" if summary is None else summary.label)
+
+
+@keybind("Previous Encounter", key="PageUp")
+def previous_encounter() -> None:
+    if is_client():
+        return
+    show_encounter(DamageMeterState.viewed_encounter + 1)
+
+
+@keybind("Next Encounter", key="PageDown")
+def next_encounter() -> None:
+    if is_client():
+        return
+    show_encounter(DamageMeterState.viewed_encounter - 1)
+
+
+@keybind("Show Kill Stats", key=None)
+def show_kill_stats() -> None:
+    if is_client():
+        return
+    enemies = DamageMeterState.enemies
+    lines = [f"Kills: {enemies.kills}, average time to kill: {enemies.average_time_to_kill:.1f}s"]
+    if enemies.recent_boss_kills:
+        boss_kill = enemies.recent_boss_kills[-1]
+        boss = enemies.bosses.get(boss_kill.name)
+        lines.append(f"Last boss: {boss_kill.name} in {boss_kill.time_to_kill:.1f}s")
+        if boss is not None:
+            lines.append(f"{boss.kills} kills, average {boss.average_time_to_kill:.1f}s, best {boss.fastest_kill:.1f}s")
+        total_damage = sum(boss_kill.damage.values())
+        for player_name, damage in sorted(boss_kill.damage.items(), key=lambda x: x[1], reverse=True):
+            lines.append(
+                f"{player_name}: {human_format(damage)} ({damage / total_damage if total_damage > 0 else 1:.0%})"
+            )
+    show_hud_message(TITLE, "\n".join(lines))
+
+
+@keybind("Show Share Rate", key=None)
+def show_share_rate() -> None:
+    if is_client():
+        return
+    scheduler = DamageMeterState.sync_scheduler
+    now = time.monotonic()
+    interval = scheduler.interval if opt_adaptive_share_interval.value else opt_share_per_five.value / 1000
+    show_hud_message(
+        TITLE,
+        f"Sharing every {interval:.1f}s with {len(DamageMeterState.player_pris) - 1} clients\n"
+        f"{scheduler.messages_per_second(now):.1f} messages/s, {scheduler.bytes_per_second(now) / 1000:.2f} KB/s",
+    )
+
+
+@keybind("Show Damage Sources", key=None)
+def show_damage_sources() -> None:
+    if is_client():
+        return
+    lines = []
+    for record in DamageMeterState.store:
+        total = record.sources.total
+        if total <= 0:
+            continue
+        sources = ", ".join(
+            f"{source.name} {source.damage / total:.0%}" + (f" (±{source.error / total:.0%})" if source.error else "")
+            for source in record.sources.top(SHOWN_SOURCES)
+        )
+        lines.append(f"{record.name}: {sources}")
+    show_hud_message(TITLE, "\n".join(lines) if lines else "No damage yet")
+
+
 # endregion
 # region Manage Players, Calculate and Send Stats
 
@@ -197,8 +374,44 @@ class DamageMeterState:
     is_paused: bool = False
     pause_start_epoch: float = 0
 
+    # filled by the damage hook, drained once per tick
+    hits: HitBuffer = HitBuffer()
+    taken_hits: HitBuffer = HitBuffer()
+    damage_seen: bool = False
+
+    # the current encounter, finished ones go into the history
+    encounter_start_epoch: float = 0
+    last_damage_epoch: float = 0
+    # set once an enemy died that took long to kill while splitting on those, the next damage starts a new encounter
+    encounter_boss: str | None = None
+    history: EncounterHistory = EncounterHistory()
+    # 0 is the current encounter, 1 the last finished one, ...
+    viewed_encounter: int = 0
+
+    # Server side, only ever changed by the writers below, readers use the snapshot
+    store: StatsStore = StatsStore()
+    # kept up to date by the spawn and logout hooks, the weak pointers notice PRIs that went away without a logout
+    player_pris: dict[str, WeakPointer] = {}
+    enemies: EnemyTable
+    # only while recording
+    combat_log: CombatLog | None = None
+    # only while keeping the stats
+    stats_journal: StatsJournal | None = None
+    # the latest world time seen, to notice it starting over after a map load
+    last_epoch: float = 0
+
     # Shared from server to client
-    player_stats: dict[str, PlayerStats] = {}
+    snapshot: StatsSnapshot = EMPTY_SNAPSHOT
+    sync_host: SyncHost = SyncHost()
+    sync_scheduler: SyncScheduler = SyncScheduler(opt_share_upload_budget.value * 1000)
+    sync_client: SyncClient = SyncClient()
+
+    # built from the snapshots, so both server and client side
+    dps_series: dict[str, DpsSeries] = {}
+    render_cache: RenderModelCache = RenderModelCache()
+
+    # Client side
+    interpolator: StatsInterpolator = StatsInterpolator()
 
 
 ## helper functions
@@ -219,6 +432,118 @@ def is_client() -> bool:
     return cast("WillowGameEngine", ENGINE).GetCurrentWorldInfo().NetMode == e_net_mode.NM_Client
 
 
+def get_enemy_name(pawn: WillowPawn) -> str:
+    # e.g. GD_Orchid_Pop_Sandworm.Character.CharClass_Orchid_Sandworm_Queen -> Orchid_Sandworm_Queen
+    ai_class = getattr(pawn, "AIClass", None)
+    if ai_class is None:
+        return pawn.Class.Name
+    return ai_class.Name.removeprefix("CharClass_")
+
+
+DamageMeterState.enemies = EnemyTable(get_enemy_name, WeakPointer)
+
+# the weak pointers notice the actor being destroyed, a new one can end up at the same address and compare equal
+enemy_names: OrderedDict[WillowPawn, tuple[WeakPointer, str]] = OrderedDict()
+source_names: OrderedDict[Actor, tuple[WeakPointer, str]] = OrderedDict()
+
+
+def get_cached_enemy_name(pawn: WillowPawn) -> str:
+    # the combat log needs the name for every hit
+    entry = enemy_names.get(pawn)
+    if entry is not None and entry[0]() is not None:
+        enemy_names.move_to_end(pawn)
+        return entry[1]
+
+    name = get_enemy_name(pawn)
+    enemy_names[pawn] = (WeakPointer(pawn), name)
+    if len(enemy_names) > MAX_TRACKED_ENEMIES:
+        enemy_names.popitem(last=False)
+    return name
+
+
+def get_damage_source(causer: Actor | None) -> Actor | None:
+    """The weapon that fired a projectile, projectiles come and go all the time so they are never kept around"""
+    if causer is None:
+        return None
+    owner = causer.Owner
+    if owner is not None and owner.Class.Name == "WillowWeapon":
+        return owner
+    return causer
+
+
+def get_source_name(source: Actor | None) -> str:
+    if source is None:
+        return "Other"
+    entry = source_names.get(source)
+    if entry is not None and entry[0]() is not None:
+        source_names.move_to_end(source)
+        return entry[1]
+
+    class_name = source.Class.Name
+    if class_name == "WillowWeapon":
+        name = cast("WillowWeapon", source).GenerateHumanReadableName()
+    else:
+        # grenades, action skills, ...
+        name = class_name.removeprefix("Willow")
+
+    source_names[source] = (WeakPointer(source), name)
+    if len(source_names) > SOURCE_NAME_CACHE_SIZE:
+        source_names.popitem(last=False)
+    return name
+
+
+def new_rolling_dps() -> RollingDps:
+    return RollingDps(tuple(DPS_WINDOWS.values()), get_current_epoch())
+
+
+def set_hidden(hidden: bool) -> None:
+    DamageMeterState.is_hidden = hidden
+    # the host only sends stats to clients that show the meter
+    if is_client():
+        subscribe_stats(not hidden)
+
+
+def get_combat_log() -> CombatLog | None:
+    """The current combat log, started on first use while the option is enabled"""
+    if DamageMeterState.combat_log is None and opt_record_combat_log.value:
+        current_epoch = get_current_epoch()
+        combat_log = DamageMeterState.combat_log = CombatLog(COMBAT_LOG_PATH)
+        combat_log.start(current_epoch)
+        for record in DamageMeterState.store:
+            combat_log.add_player(record.slot, record.name, current_epoch)
+    return DamageMeterState.combat_log
+
+
+def stop_combat_log() -> None:
+    combat_log = DamageMeterState.combat_log
+    if combat_log is None:
+        return
+    DamageMeterState.combat_log = None
+    combat_log.stop()
+    show_hud_message(
+        TITLE,
+        f"Combat log stopped: {combat_log.records} hits, {combat_log.nanoseconds_per_record / 1000:.1f} µs per hit",
+    )
+
+
+def publish_stats() -> None:
+    player_stats = DamageMeterState.store.player_stats(opt_include_overkill_damage.value)
+    DamageMeterState.snapshot = DamageMeterState.snapshot.publish(player_stats)
+
+
+def sample_dps_series(player_stats: Mapping[str, PlayerStats]) -> None:
+    all_series = DamageMeterState.dps_series
+    for player_name in [player_name for player_name in all_series if player_name not in player_stats]:
+        del all_series[player_name]
+
+    current_epoch = get_current_epoch()
+    for player_name, stats in player_stats.items():
+        series = all_series.get(player_name)
+        if series is None:
+            series = all_series[player_name] = DpsSeries()
+        series.add(current_epoch, stats["damage"])
+
+
 ## add new players to the meter
 @hook("WillowGame.WillowPlayerController:SpawningProcessComplete", Type.PRE)
 def on_spawn(
@@ -229,20 +554,132 @@ def on_spawn(
 ) -> None:
     if is_client():
         return
+    current_epoch = get_current_epoch()
+    # before add_player replaces the records of everyone coming back
+    check_world_time(current_epoch)
+    journal = get_stats_journal()
+
+    DamageMeterState.player_pris[obj.PlayerReplicationInfo.PlayerName] = WeakPointer(obj.PlayerReplicationInfo)
+    record = DamageMeterState.store.add_player(
+        obj.PlayerReplicationInfo.PlayerName,
+        obj.PlayerClass.CharacterNameId.CharacterName,
+        current_epoch,
+        new_rolling_dps(),
+        len(HIT_QUANTILES),
+    )
+    if journal is not None:
+        restore_player(record, journal, current_epoch)
+    combat_log = get_combat_log()
+    if combat_log is not None:
+        combat_log.add_player(record.slot, record.name, get_current_epoch())
+    publish_stats()
+
+
+def get_stats_journal() -> StatsJournal | None:
+    """The journal of the persisted stats, loaded on first use while the option is enabled"""
+    if DamageMeterState.stats_journal is None and opt_keep_stats.value:
+        journal = DamageMeterState.stats_journal = StatsJournal(PERSISTED_STATS_PATH)
+        journal.load()
+    return DamageMeterState.stats_journal
+
+
+def close_stats_journal(clear: bool = False) -> None:
+    """Closes the journal, clearing it if the stats should not come back the next time, e.g. on disable"""
+    if DamageMeterState.stats_journal is not None:
+        if clear:
+            DamageMeterState.stats_journal.clear()
+        DamageMeterState.stats_journal.close()
+        DamageMeterState.stats_journal = None
+
+
+def check_world_time(current_epoch: float) -> None:
+    """
+    Notices the world time starting over, which happens on every map load. Keeping the stats moves the encounter
+    to the new time, otherwise it gets finished into the history like after a timeout.
+    """
     current_state = DamageMeterState
-    player_name = obj.PlayerReplicationInfo.PlayerName
-    if player_name in current_state.player_stats:
-        number = current_state.player_stats[player_name]["number"]
-    else:
-        number = len(current_state.player_stats)
+    if current_epoch >= current_state.last_epoch:
+        current_state.last_epoch = current_epoch
+        return
+    shift_epochs(current_epoch - current_state.last_epoch)
+    current_state.last_epoch = current_epoch
+    journal = get_stats_journal()
+    if journal is not None:
+        publish_stats()
+        journal.write(current_state.snapshot.player_stats, current_epoch)
+        return
+    drain_hits()
+    finish_encounter()
 
-    current_state.player_stats[player_name] = {
-        "number": number,
-        "character_class": obj.PlayerClass.CharacterNameId.CharacterName,
-        "damage": 0,
-        "dps": 0,
-        "start_epoch": get_current_epoch(),
-    }
+
+def shift_epochs(seconds: float) -> None:
+    """Moves all times of the current encounter, e.g. after the world time started over"""
+    current_state = DamageMeterState
+    for record in current_state.store:
+        record.start_epoch += seconds
+        record.rolling_dps.shift(seconds)
+        current_state.store.mark_dirty(record)
+    current_state.encounter_start_epoch += seconds
+    current_state.last_damage_epoch += seconds
+    current_state.pause_start_epoch += seconds
+
+
+def restore_player(record: PlayerRecord, journal: StatsJournal, current_epoch: float) -> None:
+    stats = journal.stats.get(record.name)
+    if stats is None:
+        return
+    current_state = DamageMeterState
+    current_state.store.restore_player(record, stats)
+    # only the time the player was around for before the stats got written counts
+    record.start_epoch = current_epoch - (stats["epoch"] - stats["start_epoch"])
+    if stats["hits"] == 0:
+        return
+    if not current_state.damage_seen:
+        current_state.damage_seen = True
+        current_state.encounter_start_epoch = record.start_epoch
+    current_state.encounter_start_epoch = min(current_state.encounter_start_epoch, record.start_epoch)
+    # the time spent loading should not end the encounter
+    current_state.last_damage_epoch = current_epoch
+
+
+def coroutine_persist_stats() -> TickCoroutine:
+    while True:
+        yield WaitForSeconds(WRITE_INTERVAL)
+        if not mod.is_enabled:
+            return
+        if is_client():
+            continue
+        journal = get_stats_journal()
+        if journal is None:
+            continue
+        # an empty snapshot would only mean nobody spawned yet, e.g. in the main menu
+        current_epoch = get_current_epoch()
+        check_world_time(current_epoch)
+        if DamageMeterState.snapshot.player_stats:
+            journal.write(DamageMeterState.snapshot.player_stats, current_epoch)
+
+
+def remove_player(player_name: str) -> None:
+    DamageMeterState.player_pris.pop(player_name, None)
+    DamageMeterState.store.remove_player(player_name)
+    DamageMeterState.sync_host.remove_client(player_name)
+
+
+## remove players as soon as they leave
+@hook("Engine.GameInfo:Logout", Type.PRE)
+def on_logout(
+    __obj: GameInfo,
+    args: GameInfo._Logout.args,
+    __ret: GameInfo._Logout.ret,
+    __func: GameInfo._Logout,
+) -> None:
+    if is_client():
+        return
+    pri = args.Exiting.PlayerReplicationInfo
+    if pri is None:
+        return
+    remove_player(pri.PlayerName)
+    publish_stats()
 
 
 ## track damage dealt
@@ -260,9 +697,26 @@ def took_damage_from_enemy(
     if DamageMeterState.is_paused:
         return
 
-    # discard if a player got damaged (prevent counting friendly fire/damaging yourself)
-    # could track taken damage in the future
+    pipeline = args.Pipeline
+    damage_summary = pipeline.DamageSummary
+
+    # players getting damaged only counts as damage taken (prevent counting friendly fire/damaging yourself)
     if obj.Class.Name == "WillowPlayerPawn":
+        # a pawn nobody possesses anymore has no PRI
+        pri = obj.PlayerReplicationInfo
+        slot = None if pri is None else DamageMeterState.store.slots.get(pri.PlayerName)
+        if slot is not None:
+            taken_hits = DamageMeterState.taken_hits
+            if taken_hits.append(
+                slot,
+                damage_summary.FinalDamage,
+                damage_summary.DamageDealtToShields,
+                0,
+                damage_summary.PreviousHealth,
+                obj,
+                None,
+            ):
+                drain_hits()
         return
 
     # discard enviroment / other AI damage
@@ -270,21 +724,106 @@ def took_damage_from_enemy(
     if instigator is None or instigator.Class.Name != "WillowPlayerController":
         return
     instigator = cast("WillowPlayerController", instigator)
-
-    # a bit hacky, but wait with dps calculation until first damage
-    if max(stats["damage"] for stats in DamageMeterState.player_stats.values()) == 0:
-        for player in DamageMeterState.player_stats:
-            DamageMeterState.player_stats[player]["start_epoch"] = get_current_epoch()
+    slot = DamageMeterState.store.slots.get(instigator.PlayerReplicationInfo.PlayerName)
+    if slot is None:
+        return
 
     # FinalDamage only includes flesh/armor damage
-    # Could split this for more detailed stats in the future
-    damage_summary = args.Pipeline.DamageSummary
-    damage = damage_summary.FinalDamage + damage_summary.DamageDealtToShields
+    # everything else (overkill option, start epoch, ...) is handled when the buffer gets drained
+    flesh = damage_summary.FinalDamage
+    shield = damage_summary.DamageDealtToShields
+    health = damage_summary.PreviousHealth
+    overkill = flesh + shield - health
+    if DamageMeterState.hits.append(
+        slot, flesh, shield, overkill if overkill > 0 else 0, health, obj, get_damage_source(pipeline.DamageCauser)
+    ):
+        # only happens if the tick coroutine did not run for a long time
+        drain_hits()
+
+
+## move the buffered hits into the stats
+def drain_hits() -> None:
+    current_state = DamageMeterState
+    store = current_state.store
+    if current_state.hits.size == 0 and current_state.taken_hits.size == 0:
+        return
 
-    if not opt_include_overkill_damage.value:
-        if damage > damage_summary.PreviousHealth:
-            damage = damage_summary.PreviousHealth
-    DamageMeterState.player_stats[instigator.PlayerReplicationInfo.PlayerName]["damage"] += int(damage)
+    current_epoch = get_current_epoch()
+    combat_log = get_combat_log()
+    if combat_log is not None:
+        combat_log.add_hits(current_state.hits, current_epoch, KIND_HIT, get_cached_enemy_name, get_source_name)
+        combat_log.add_hits(current_state.taken_hits, current_epoch, KIND_TAKEN, None, None)
+
+    if current_state.hits.size > 0:
+        if (
+            opt_split_encounters.value
+            and current_state.damage_seen
+            and (
+                current_state.encounter_boss is not None
+                or current_epoch - current_state.last_damage_epoch > opt_encounter_timeout.value
+            )
+        ):
+            finish_encounter()
+
+        # a bit hacky, but wait with dps calculation until first damage
+        if not current_state.damage_seen:
+            current_state.damage_seen = True
+            current_state.encounter_start_epoch = current_epoch
+            for record in store:
+                record.start_epoch = current_epoch
+                record.rolling_dps = new_rolling_dps()
+                store.mark_dirty(record)
+
+        include_overkill = opt_include_overkill_damage.value
+        player_names = {record.slot: record.name for record in store}
+        boss_kills = current_state.enemies.add_hits(current_state.hits, current_epoch, player_names, include_overkill)
+        # there is no reliable way to tell a boss apart, so this only guesses by the time to kill
+        if boss_kills and opt_split_on_long_kills.value:
+            current_state.encounter_boss = boss_kills[-1].name
+        store.add_hits(current_state.hits, current_epoch, include_overkill, get_source_name)
+        current_state.hits.clear()
+        current_state.last_damage_epoch = current_epoch
+
+    store.add_damage_taken(current_state.taken_hits)
+    current_state.taken_hits.clear()
+    publish_stats()
+
+
+def finish_encounter() -> None:
+    """Moves the current encounter into the history and starts a new one with all stats at zero"""
+    current_state = DamageMeterState
+    store = current_state.store
+    if current_state.damage_seen:
+        # the dps of a finished encounter should not include the time after the last damage
+        store.update_rates(current_state.last_damage_epoch, opt_include_overkill_damage.value, HIT_QUANTILES.values())
+        publish_stats()
+        current_state.history.add(
+            current_state.last_damage_epoch - current_state.encounter_start_epoch,
+            current_state.encounter_boss,
+            current_state.snapshot.player_stats,
+        )
+        # keep looking at the same encounter
+        if current_state.viewed_encounter > 0:
+            current_state.viewed_encounter = min(current_state.viewed_encounter + 1, len(current_state.history))
+
+    current_state.damage_seen = False
+    current_state.encounter_boss = None
+    if current_state.stats_journal is not None:
+        current_state.stats_journal.forget()
+    for series in current_state.dps_series.values():
+        series.clear()
+    store.reset()
+    for record in store:
+        record.rolling_dps = new_rolling_dps()
+    publish_stats()
+
+
+def coroutine_drain_hits() -> TickCoroutine:
+    while True:
+        yield
+        if not mod.is_enabled:
+            return
+        drain_hits()
 
 
 ## track dps independently of damage dealt
@@ -295,121 +834,235 @@ def coroutine_calculate_dps() -> TickCoroutine:
             return
         if is_client():
             continue
-
-        # deepcopy to prevent error if player disconnects during iteration
-        current_stats = deepcopy(DamageMeterState.player_stats)
         current_epoch = get_current_epoch()
-        for player_name, stats in current_stats.items():
-            if not DamageMeterState.is_paused:
-                stats["dps"] = max(stats["damage"] / (current_epoch - stats["start_epoch"] + 1), 0)
-        DamageMeterState.player_stats = current_stats
+        # also while paused, the pause start moves along with everything else
+        check_world_time(current_epoch)
+
+        if DamageMeterState.is_paused:
+            continue
+
+        DamageMeterState.enemies.evict_inactive(current_epoch)
+        # only up to the last damage, so the stats stop changing between fights and there is nothing to share
+        DamageMeterState.store.update_rates(
+            DamageMeterState.last_damage_epoch, opt_include_overkill_damage.value, HIT_QUANTILES.values()
+        )
+        publish_stats()
+        sample_dps_series(DamageMeterState.snapshot.player_stats)
 
 
 ## send stats to clients
 
 
 def coroutine_send_stats() -> TickCoroutine:
+    scheduler = DamageMeterState.sync_scheduler
     while True:
-        yield WaitForSeconds(opt_share_per_five.value / 1000)
+        if opt_adaptive_share_interval.value:
+            yield WaitUntil(lambda: scheduler.is_due(time.monotonic(), DamageMeterState.snapshot.version))
+        else:
+            yield WaitForSeconds(opt_share_per_five.value / 1000)
         if not mod.is_enabled:
             return
         if is_client():
             continue
 
-        pc = get_pc_cast()
-        disconnected_players = []
-        for player_name, stats in DamageMeterState.player_stats.items():
+        version = DamageMeterState.snapshot.version
+        result = send_stats()
+        scheduler.upload_budget = opt_share_upload_budget.value * 1000
+        scheduler.update(
+            time.monotonic(),
+            version,
+            result.sent_bytes,
+            result.messages,
+            result.largest_message,
+            len(DamageMeterState.player_pris) - 1,
+        )
+
+
+def send_stats() -> SendResult:
+    """Sends the changes to all clients and removes the players that are gone"""
+    result = send_to_clients(
+        DamageMeterState.sync_host,
+        DamageMeterState.snapshot,
+        get_pc_cast().PlayerReplicationInfo.PlayerName,
+        get_player_pri,
+        send_to_client,
+        opt_compact_network_format.value,
+    )
+
+    # remove disconnected players
+    for player in result.disconnected:
+        remove_player(player)
+    if result.disconnected:
+        publish_stats()
+    return result
+
 
-            # mark disconnected players
-            pri = next((pri for pri in pc.WorldInfo.GRI.PRIArray if pri.PlayerName == player_name), None)
-            if pri is None:
-                disconnected_players.append(player_name)
-                continue
+def get_player_pri(player_name: str) -> PlayerReplicationInfo | None:
+    # players normally get removed by the logout hook, this only catches the ones it missed
+    pointer = DamageMeterState.player_pris.get(player_name)
+    return None if pointer is None else cast("PlayerReplicationInfo | None", pointer())
 
-            # send stats to clients
-            if pri != pc.PlayerReplicationInfo:
-                send_stats_single_target(pri, DamageMeterState.player_stats)
 
-        # remove disconnected players
-        for player in disconnected_players:
-            del DamageMeterState.player_stats[player]
+def send_to_client(pri: PlayerReplicationInfo, data: str | StatsMessage, _size: int) -> None:
+    if isinstance(data, str):
+        send_stats_compact(pri, data)
+    else:
+        send_stats_single_target(pri, data)
 
 
 @targeted.json_message
-def send_stats_single_target(stats: dict[str, PlayerStats]) -> None:
-    DamageMeterState.player_stats = stats
+def send_stats_single_target(message: StatsMessage) -> None:
+    receive_stats(message)
 
 
-# endregion
-# region Drawing
+@targeted.string_message
+def send_stats_compact(encoded: str) -> None:
+    receive_stats(encoded)
 
 
-# straight from SO @rtaft https://stackoverflow.com/a/45846841
-def human_format(num: float) -> str:
-    num = float("{:.3g}".format(num))
-    magnitude = 0
-    while abs(num) >= 1000:
-        magnitude += 1
-        num /= 1000.0
-    return "{}{}".format("{:f}".format(num).rstrip("0").rstrip("."), ["", "K", "M", "B", "T", "Q", "E"][magnitude])
+def receive_stats(data: str | StatsMessage) -> None:
+    player_stats = receive_from_host(
+        DamageMeterState.sync_client, data, not DamageMeterState.is_hidden, acknowledge_stats, subscribe_stats
+    )
+    if player_stats is None:
+        return
+    DamageMeterState.snapshot = DamageMeterState.snapshot.publish(player_stats)
+    sample_dps_series(DamageMeterState.snapshot.player_stats)
 
 
-canv = drawing.Drawing(options=MeterOptions, hidden_options=[MeterOptions.FONT, MeterOptions.SHOW_BARS])
+def get_sender_name(sender: PlayerReplicationInfo | None) -> str | None:
+    """
+    The player a message from a client came from, as known to the network layer, a player name in the message
+    could be anyone's. None unless the player is still connected, everything else gets cleaned up with the player.
+    """
+    if sender is None or sender.PlayerName not in DamageMeterState.player_pris:
+        return None
+    return sender.PlayerName
 
 
-def draw_meter(canvas: Canvas, player_stats: dict[str, PlayerStats]) -> None:
-    canv.reset_state(canvas)
-    canv.draw_background()
+## sent by clients to the host
+@host.json_message
+def acknowledge_stats(version: int) -> None:
+    player_name = get_sender_name(acknowledge_stats.sender)
+    if player_name is not None:
+        DamageMeterState.sync_host.acknowledge(player_name, version)
 
-    class_title_text = " - Class" if opt_show_class.value else ""
-    canv.draw_text_current_line("Name" + class_title_text, drawing.GOLD_COLOR)
 
-    pos = 0
-    for type, toggled_option in RHS_COLUMNS.items():
-        if toggled_option.value:
-            canv.draw_text_rhs_column(type.value, pos, drawing.GOLD_COLOR)
-            pos += 1
+@host.json_message
+def subscribe_stats(subscribed: bool) -> None:
+    player_name = get_sender_name(subscribe_stats.sender)
+    if player_name is not None:
+        DamageMeterState.sync_host.subscribe(player_name, subscribed)
 
-    canv.new_line()
 
-    # sort by damage dealt
+# endregion
+# region Drawing
 
-    total_damage = sum(stat["damage"] for stat in player_stats.values())
-    for player_name, stats in sorted(player_stats.items(), key=lambda x: x[1]["damage"], reverse=True):
-        class_attrs = ATTRIBUTES[stats["character_class"]]
-        player_damage = stats["damage"]
 
-        # is used for either the bar or text, depending on whether the bars are shown
-        variable_color = (
-            class_attrs["color"] if opt_color_by.value == ColorBy.CLASS.value else PLAYER_COLORS[stats["number"]]
-        )
+canv = drawing.Drawing(options=MeterOptions, hidden_options=[MeterOptions.FONT, MeterOptions.SHOW_BARS])
 
-        if opt_show_bars.value:
-            highest_damage = max(stats["damage"] for stats in player_stats.values())
-            percent = player_damage / highest_damage if highest_damage > 0 else 1
-            text_color = drawing.WHITE_COLOR
-            canv.draw_bar(percent, variable_color)
-        else:
-            text_color = variable_color
-            canv.draw_hline_top(drawing.WHITE_COLOR)
 
-        values: dict[ColumnType, str] = {
-            ColumnType.PARTY_PERCENT: f"{player_damage / total_damage if total_damage > 0 else 1:.0%}",
-            ColumnType.DAMAGE: human_format(player_damage),
-            ColumnType.DPS: human_format(stats["dps"]),
-        }
+## the textures, fonts and enemies of the old world may be gone, the textures and fonts get looked up again
+@hook("WillowGame.WillowPlayerController:WillowClientDisableLoadingMovie")
+def on_world_loaded(
+    __obj: WillowPlayerController,
+    __args: WillowPlayerController._WillowClientDisableLoadingMovie.args,
+    __ret: WillowPlayerController._WillowClientDisableLoadingMovie.ret,
+    __func: WillowPlayerController._WillowClientDisableLoadingMovie,
+) -> None:
+    drawing.RESOURCES.clear()
+    # the world time started over, so the enemies of the old map would never time out
+    DamageMeterState.enemies.clear()
+
+
+def get_player_color(stats: PlayerStats) -> Object.Color:
+    if opt_color_by.value == ColorBy.CLASS.value:
+        return ATTRIBUTES[stats["character_class"]]["color"]
+    return PLAYER_COLORS[stats["number"]]
+
+
+def draw_dps_graph(player_stats: Mapping[str, PlayerStats], dps_series: Mapping[str, DpsSeries]) -> None:
+    # the points only get recalculated once a new sample arrived
+    threshold = max(canv.layout.width // GRAPH_PIXELS_PER_POINT, 3)
+    graphs = [
+        (stats, dps_series[player_name].points(threshold), dps_series[player_name].duration)
+        for player_name, stats in player_stats.items()
+        if player_name in dps_series
+    ]
+    duration = max((duration for _, _, duration in graphs), default=0)
+    highest_dps = max((dps for _, points, _ in graphs for _, dps in points), default=0)
+    if duration <= 0 or highest_dps <= 0:
+        return
 
-        class_text = (" - " + class_attrs["display_name"]) if opt_show_class.value else ""
-        canv.draw_text_current_line(player_name + class_text, text_color)
+    canv.draw_hline_top(drawing.WHITE_COLOR)
+    for stats, points, _ in graphs:
+        canv.draw_graph([(x / duration, dps / highest_dps) for x, dps in points], get_player_color(stats), GRAPH_LINES)
+    canv.new_line(GRAPH_LINES)
+
+
+def get_render_model(player_stats: Mapping[str, PlayerStats], title: str) -> RenderModel:
+    # only rebuilt when the stats or an option that changes the content of the meter changed
+    columns = tuple(column for column, toggled_option in RHS_COLUMNS.items() if toggled_option.value)
+    show_class = opt_show_class.value
+    return DamageMeterState.render_cache.get(
+        player_stats,
+        (title, columns, show_class, opt_color_by.value),
+        lambda: build_render_model(
+            player_stats,
+            title,
+            columns,
+            CLASS_DISPLAY_NAMES if show_class else None,
+            get_player_color,
+        ),
+    )
 
-        pos = 0
-        for type, toggled_option in RHS_COLUMNS.items():
-            if toggled_option.value:
-                canv.draw_text_rhs_column(values[type], pos, text_color)
-                pos += 1
 
+def draw_meter(
+    canvas: Canvas,
+    player_stats: Mapping[str, PlayerStats],
+    title: str = "Name",
+    dps_series: Mapping[str, DpsSeries] | None = None,
+) -> None:
+    model = get_render_model(player_stats, title)
+    show_bars = opt_show_bars.value
+    graph_series = dps_series if opt_show_graph.value and dps_series else None
+    # the graph changes whenever a series got a new sample
+    graph_key = None if graph_series is None else tuple((name, series.version) for name, series in graph_series.items())
+    canv.draw_retained(
+        canvas,
+        (model, show_bars, graph_key),
+        lambda: draw_render_model(model, show_bars, player_stats, graph_series),
+    )
+
+
+def draw_render_model(
+    model: RenderModel,
+    show_bars: bool,
+    player_stats: Mapping[str, PlayerStats],
+    dps_series: Mapping[str, DpsSeries] | None,
+) -> None:
+    canv.draw_text_current_line(model.title, drawing.GOLD_COLOR)
+    for pos, column_title in enumerate(model.column_titles):
+        canv.draw_text_rhs_column(column_title, pos, drawing.GOLD_COLOR)
+    canv.new_line()
+
+    for row in model.rows:
+        # the player color is used for either the bar or text, depending on whether the bars are shown
+        if show_bars:
+            text_color = drawing.WHITE_COLOR
+            canv.draw_bar(row.bar_fraction, row.color)
+        else:
+            text_color = row.color
+            canv.draw_hline_top(drawing.WHITE_COLOR)
+
+        canv.draw_text_current_line(row.label, text_color)
+        for pos, value in enumerate(row.values):
+            canv.draw_text_rhs_column(value, pos, text_color)
         canv.new_line()
 
+    if dps_series is not None:
+        draw_dps_graph(player_stats, dps_series)
+
 
 ## draw meter in game
 def coroutine_draw_meter() -> PostRenderCoroutine:
@@ -420,7 +1073,43 @@ def coroutine_draw_meter() -> PostRenderCoroutine:
         canvas = yield
         if DamageMeterState.is_hidden or opt_show_example_ui.value:
             continue
-        draw_meter(canvas, DamageMeterState.player_stats)
+        summary = DamageMeterState.history.get(DamageMeterState.viewed_encounter)
+        if summary is not None:
+            draw_meter(canvas, summary.player_stats, summary.label)
+            continue
+        player_stats = DamageMeterState.snapshot.player_stats
+        if opt_smooth_client_values.value and is_client():
+            player_stats = DamageMeterState.interpolator.stats(DamageMeterState.snapshot, time.monotonic())
+        draw_meter(canvas, player_stats, dps_series=DamageMeterState.dps_series)
+
+
+def example_stats(number: int, character_class: str, damage: int, dps: float) -> PlayerStats:
+    return {
+        "number": number,
+        "character_class": character_class,
+        "damage": damage,
+        "flesh_damage": damage * 2 // 3,
+        "shield_damage": damage // 3,
+        "overkill_damage": damage // 20,
+        "damage_taken": damage // 50,
+        "hits": damage // 100000,
+        "dps": dps,
+        "window_dps": [dps * 1.5, dps * 1.1],
+        "biggest_hit": dps * 4,
+        "hit_quantiles": [dps / 8, dps / 2, dps],
+        "start_epoch": 0,
+    }
+
+
+# a constant, so the render model of the example gets built once
+EXAMPLE_STATS: Mapping[str, PlayerStats] = {
+    "Player1": example_stats(0, "Zero", 1245678900, 7650),
+    "Player2": example_stats(1, "Maya", 5238901230, 804321),
+    "Player3": example_stats(2, "Krieg", 28941234560, 3021098),
+    "Player4": example_stats(3, "Gaige", 39012345678, 43008765),
+    "Player5": example_stats(4, "Axton", 8123456789, 5650),
+    "Player6": example_stats(5, "Krieg", 40123456789, 2021098),
+}
 
 
 # draw example meter when setting is enabled
@@ -436,17 +1125,7 @@ def draw_example_ui(
     canvas = args.Canvas
     if canvas is None:
         return
-    draw_meter(
-        canvas,
-        {
-            "Player1": {"damage": 1245678900, "dps": 7650, "character_class": "Zero", "number": 0},
-            "Player2": {"damage": 5238901230, "dps": 804321, "character_class": "Maya", "number": 1},
-            "Player3": {"damage": 28941234560, "dps": 3021098, "character_class": "Krieg", "number": 2},
-            "Player4": {"damage": 39012345678, "dps": 43008765, "character_class": "Gaige", "number": 3},
-            "Player5": {"damage": 8123456789, "dps": 5650, "character_class": "Axton", "number": 4},
-            "Player6": {"damage": 40123456789, "dps": 2021098, "character_class": "Krieg", "number": 5},
-        },
-    )
+    draw_meter(canvas, EXAMPLE_STATS)
     drawing.draw_text_current_line("EXAMPLE UI - TOGGLE OFF AFTER CONFIGURATING", drawing.RED_COLOR)
 
 
@@ -457,20 +1136,37 @@ def draw_example_ui(
 def on_enable():
 
     start_coroutine_post_render(coroutine_draw_meter())
+    start_coroutine_tick(coroutine_drain_hits())
     start_coroutine_tick(coroutine_send_stats())
     start_coroutine_tick(coroutine_calculate_dps())
+    start_coroutine_tick(coroutine_persist_stats())
     opt_show_example_ui.value = False
 
 
+def on_disable():
+    stop_combat_log()
+    close_stats_journal(clear=True)
+
+
 mod = build_mod(
     options=[
         opt_default_active,
         opt_include_overkill_damage,
         opt_dps_update_interval,
         opt_share_per_five,
+        opt_adaptive_share_interval,
+        opt_share_upload_budget,
+        opt_split_encounters,
+        opt_split_on_long_kills,
+        opt_encounter_timeout,
+        opt_record_combat_log,
+        opt_keep_stats,
+        opt_compact_network_format,
+        opt_smooth_client_values,
         canv.opt_group,
     ],
     on_enable=on_enable,
+    on_disable=on_disable,
     coop_support=CoopSupport.RequiresAllPlayers,  # not all but atleast host
     supported_games=Game.BL2,
 )
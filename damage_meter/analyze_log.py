@@ -0,0 +1,479 @@
+"""
+Offline analysis of the combat logs written by the damage meter, runs outside of the game and needs numpy.
+
+    python analyze_log.py [--no-overkill] [--timeout 15] [--sources 3] [--json] <log files or directories>
+
+Segments are streamed one at a time, uncompressed ones get memory mapped, compressed ones are decompressed. Each
+segment is turned into a few columns and added up per encounter and player with vectorized passes, using the same
+definitions as the columns of the meter, then it is dropped. Hit sizes go into the same mergeable sketch as in game,
+so the quantiles are the estimates the meter would show. The rolling DPS columns show the highest value of an
+encounter.
+"""
+
+from __future__ import annotations
+import argparse
+import gzip
+import json
+import mmap
+import sys
+from pathlib import Path
+from typing import NamedTuple, cast
+
+import numpy as np
+
+from offline import load_pure_modules
+
+columns, combat_log, dps, quantiles = load_pure_modules("columns", "combat_log", "dps", "quantiles")
+
+RECORD_DTYPE = np.dtype(
+    [
+        ("epoch", "<f8"),
+        ("kind", "u1"),
+        ("slot", "u1"),
+        ("target", "<u2"),
+        ("source", "<u2"),
+        ("reserved", "<u2"),
+        ("flesh", "<f4"),
+        ("shield", "<f4"),
+        ("overkill", "<f4"),
+        ("health", "<f4"),
+    ]
+)
+NAME_DTYPE = np.dtype(
+    [
+        ("epoch", "<f8"),
+        ("kind", "u1"),
+        ("slot", "u1"),
+        ("target", "<u2"),
+        ("source", "<u2"),
+        ("reserved", "<u2"),
+        ("name", "S16"),
+    ]
+)
+assert RECORD_DTYPE.itemsize == combat_log.RECORD.size == NAME_DTYPE.itemsize == combat_log.NAME_RECORD.size
+
+# same default as the Encounter Timeout option
+DEFAULT_ENCOUNTER_TIMEOUT = 15
+UNKNOWN_NAME = "Unknown"
+# only used for the bucket layout
+SKETCH = quantiles.HitSizeSketch()
+
+
+class Names:
+    """All names of the analysed logs, the ids in the logs are only valid within one log"""
+
+    def __init__(self) -> None:
+        self.names: list[str] = [UNKNOWN_NAME]
+        self.ids: dict[str, int] = {UNKNOWN_NAME: 0}
+
+    def id(self, name: str) -> int:
+        name_id = self.ids.get(name)
+        if name_id is None:
+            name_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+
+class Hits(NamedTuple):
+    epoch: np.ndarray
+    player: np.ndarray
+    target: np.ndarray
+    source: np.ndarray
+    flesh: np.ndarray
+    shield: np.ndarray
+    overkill: np.ndarray
+    taken: np.ndarray
+    # the world time starts at 0 again in a new log
+    new_log: np.ndarray
+
+
+def find_segments(paths: list[Path]) -> list[Path]:
+    segments: list[Path] = []
+    for path in paths:
+        if path.is_dir():
+            segments.extend(
+                child
+                for child in path.iterdir()
+                if child.name.endswith(combat_log.SEGMENT_SUFFIX) or child.name.endswith(combat_log.COMPRESSED_SUFFIX)
+            )
+        else:
+            segments.append(path)
+    # named after the start of the log and the segment number, so this is the order they were written in
+    return sorted(segments, key=lambda segment: segment.name)
+
+
+def log_name(segment: Path) -> str:
+    return segment.name.rsplit("_", 1)[0]
+
+
+def read_segment(segment: Path) -> np.ndarray:
+    if segment.name.endswith(combat_log.COMPRESSED_SUFFIX):
+        with gzip.open(segment, "rb") as file:
+            data: bytes | mmap.mmap = file.read()
+    else:
+        with segment.open("rb") as file:
+            if segment.stat().st_size < combat_log.RECORD.size:
+                return np.empty(0, RECORD_DTYPE)
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # a segment that is still being written can end with half a record
+    records = np.frombuffer(data, RECORD_DTYPE, count=len(data) // combat_log.RECORD.size)
+    if len(records) == 0 or records[0]["kind"] != combat_log.KIND_HEADER:
+        raise ValueError(f"{segment} is not a damage meter combat log")
+    header = records[:1].view(NAME_DTYPE)[0]
+    if not header["name"].startswith(combat_log.MAGIC):
+        raise ValueError(f"{segment} is not a damage meter combat log")
+    return records
+
+
+def name_lookup(records: np.ndarray, names: Names) -> np.ndarray:
+    """Array mapping the name ids of the segment to ids in names"""
+    definitions = records[records["kind"] == combat_log.KIND_NAME].view(NAME_DTYPE)
+    chunks: dict[int, dict[int, bytes]] = {}
+    for name_id, chunk_index, chunk in zip(
+        definitions["target"].tolist(), definitions["slot"].tolist(), definitions["name"].tolist()
+    ):
+        chunks.setdefault(name_id, {})[chunk_index] = chunk
+
+    lookup = np.zeros(max(chunks, default=combat_log.NO_NAME) + 1, np.int32)
+    for name_id, name_chunks in chunks.items():
+        name = b"".join(name_chunks[i] for i in sorted(name_chunks)).decode("utf-8", "replace")
+        lookup[name_id] = names.id(name)
+    return lookup
+
+
+def segment_hits(records: np.ndarray, names: Names, new_log: bool) -> Hits:
+    lookup = name_lookup(records, names)
+    kinds = records["kind"]
+    hit_rows = np.flatnonzero((kinds == combat_log.KIND_HIT) | (kinds == combat_log.KIND_TAKEN))
+    hits = records[hit_rows]
+
+    # slots get reused, a hit belongs to the last player announced in its slot before it
+    player = np.zeros(len(hits), np.int32)
+    player_rows = np.flatnonzero(kinds == combat_log.KIND_PLAYER)
+    player_records = records[player_rows]
+    for slot in np.unique(player_records["slot"]).tolist():
+        in_slot = player_records["slot"] == slot
+        slot_rows = player_rows[in_slot]
+        slot_players = lookup[player_records["target"][in_slot]]
+        hits_in_slot = np.flatnonzero(hits["slot"] == slot)
+        announced = np.searchsorted(slot_rows, hit_rows[hits_in_slot]) - 1
+        known = announced >= 0
+        player[hits_in_slot[known]] = slot_players[announced[known]]
+
+    starts = np.zeros(len(hits), bool)
+    if new_log and len(hits) > 0:
+        starts[0] = True
+    return Hits(
+        epoch=hits["epoch"],
+        player=player,
+        target=lookup[hits["target"]],
+        source=lookup[hits["source"]],
+        flesh=hits["flesh"].astype(np.float64),
+        shield=hits["shield"].astype(np.float64),
+        overkill=hits["overkill"].astype(np.float64),
+        taken=hits["kind"] == combat_log.KIND_TAKEN,
+        new_log=starts,
+    )
+
+
+class PlayerTotals:
+    """Stats of a player in an encounter or in all of them, added up segment by segment"""
+
+    __slots__ = ("damage", "taken", "hits", "hit_sizes", "window_dps", "buckets")
+
+    def __init__(self) -> None:
+        self.damage = 0.0
+        self.taken = 0.0
+        self.hits = 0
+        # the same sketch as the meter, which can be merged over segments and encounters
+        self.hit_sizes = quantiles.HitSizeSketch()
+        # highest rolling dps of every window, known once the encounter is finished
+        self.window_dps = [0.0] * len(columns.DPS_WINDOWS)
+        # damage per BUCKET_WIDTH since the start of the encounter, only kept until it is finished
+        self.buckets = np.zeros(0)
+
+    def add_buckets(self, buckets: np.ndarray) -> None:
+        if len(buckets) > len(self.buckets):
+            buckets, self.buckets = self.buckets, buckets.copy()
+        self.buckets[: len(buckets)] += buckets
+
+
+class EncounterTotals:
+    __slots__ = ("number", "first", "last", "players")
+
+    def __init__(self, number: int) -> None:
+        self.number = number
+        # first and last damage dealt
+        self.first = np.inf
+        self.last = -np.inf
+        # player name id -> totals
+        self.players: dict[int, PlayerTotals] = {}
+
+    @property
+    def duration(self) -> float:
+        return float(self.last - self.first) if self.first <= self.last else 0.0
+
+
+def peak_window_dps(buckets: np.ndarray, window: float, duration: float) -> float:
+    """Highest rolling dps, like the meter only counting the time of the encounter if it is shorter than the window"""
+    if len(buckets) == 0:
+        return 0.0
+    width = max(int(window / dps.BUCKET_WIDTH), 1)
+    total = np.concatenate(([0.0], np.cumsum(buckets)))
+    in_window = total[width:] - total[:-width] if len(total) > width else total[-1:]
+    return float(in_window.max()) / max(min(window, duration), dps.BUCKET_WIDTH)
+
+
+def sketch_indices(values: np.ndarray) -> np.ndarray:
+    """Bucket of every value in a HitSizeSketch, the same as adding them one by one"""
+    indices = np.zeros(len(values), np.int64)
+    above_one = values > 1
+    indices[above_one] = np.minimum(
+        np.ceil(np.log(values[above_one]) / SKETCH.log_gamma), len(SKETCH.counts) - 1
+    ).astype(np.int64)
+    return indices
+
+
+class LogAnalysis:
+    """
+    Stats of a series of log segments, fed one segment at a time.
+
+    Every segment is reduced to totals per encounter and player with vectorized passes and then dropped. Only the
+    encounter that is still going on at the end of a segment keeps its damage over time, every finished one is
+    turned into its summary right away, so memory stays flat no matter how big the logs are.
+    """
+
+    def __init__(self, names: Names, timeout: float, include_overkill: bool) -> None:
+        self.names = names
+        self.timeout = timeout
+        self.include_overkill = include_overkill
+        # last damage dealt in the earlier segments, new encounters start after a gap in it
+        self.last_dealt_epoch: float | None = None
+        self.current: EncounterTotals | None = None
+        self.encounters: list[dict] = []
+        self.totals: dict[int, PlayerTotals] = {}
+        self.duration = 0.0
+        # (player name id, source name id) -> damage
+        self.sources: dict[tuple[int, int], float] = {}
+
+    def split_encounters(self, hits: Hits) -> np.ndarray:
+        """Encounter number of every hit, like in game a new encounter starts with damage after the timeout"""
+        dealt = np.flatnonzero(~hits.taken)
+        starts = hits.new_log.copy()
+        if len(dealt) > 0:
+            previous = -np.inf if self.last_dealt_epoch is None else self.last_dealt_epoch
+            gaps = np.diff(hits.epoch[dealt], prepend=previous)
+            # the world time also restarts on every map change
+            starts[dealt] |= (gaps > self.timeout) | (gaps < 0)
+            self.last_dealt_epoch = float(hits.epoch[dealt[-1]])
+        current = -1 if self.current is None else self.current.number
+        return np.maximum(current + np.cumsum(starts), 0)
+
+    def add_segment(self, hits: Hits) -> None:
+        if len(hits.epoch) == 0:
+            return
+        encounter = self.split_encounters(hits)
+        first_number = int(encounter[0])
+        encounters = int(encounter[-1]) - first_number + 1
+        players, player_index = np.unique(hits.player, return_inverse=True)
+        groups = encounters * len(players)
+        group = (encounter - first_number) * len(players) + player_index
+
+        dealt = ~hits.taken
+        damage = columns.damage_dealt(
+            hits.flesh[dealt], hits.shield[dealt], hits.overkill[dealt], self.include_overkill
+        )
+        dealt_group = group[dealt]
+        dealt_epoch = hits.epoch[dealt]
+        dealt_encounter = encounter[dealt] - first_number
+
+        first = np.full(encounters, np.inf)
+        last = np.full(encounters, -np.inf)
+        np.minimum.at(first, dealt_encounter, dealt_epoch)
+        np.maximum.at(last, dealt_encounter, dealt_epoch)
+        # the first encounter may have started in an earlier segment
+        continues = self.current is not None and self.current.number == first_number
+        if continues:
+            first[0] = min(first[0], self.current.first)  # type: ignore
+
+        total_damage = np.bincount(dealt_group, weights=damage, minlength=groups)
+        hit_count = np.bincount(dealt_group, minlength=groups)
+        taken = np.bincount(group[~dealt], weights=hits.flesh[~dealt] + hits.shield[~dealt], minlength=groups)
+        biggest_hit = np.zeros(groups)
+        np.maximum.at(biggest_hit, dealt_group, damage)
+        # hits per group and sketch bucket, only the used buckets of every group
+        sketch_key = dealt_group * len(SKETCH.counts) + sketch_indices(damage)
+        sketch_keys, sketch_counts = np.unique(sketch_key, return_counts=True)
+        sketch_groups, sketch_buckets = np.divmod(sketch_keys, len(SKETCH.counts))
+        sketch_starts = np.searchsorted(sketch_groups, np.arange(groups + 1))
+
+        # damage over time relative to the start of the encounter
+        time_bucket = ((dealt_epoch - first[dealt_encounter]) / dps.BUCKET_WIDTH).astype(np.int64)
+        order = np.argsort(dealt_group, kind="stable")
+        group_starts = np.searchsorted(dealt_group[order], np.arange(groups + 1))
+
+        for number in range(encounters):
+            if number > 0 or not continues:
+                self.finish_encounter()
+                self.current = EncounterTotals(first_number + number)
+            current = cast(EncounterTotals, self.current)
+            current.first = min(current.first, first[number])
+            current.last = max(current.last, last[number])
+            for player in range(len(players)):
+                g = number * len(players) + player
+                if hit_count[g] == 0 and taken[g] == 0:
+                    continue
+                totals = current.players.get(int(players[player]))
+                if totals is None:
+                    totals = current.players[int(players[player])] = PlayerTotals()
+                totals.damage += total_damage[g]
+                totals.taken += taken[g]
+                totals.hits += int(hit_count[g])
+                bucket_range = slice(sketch_starts[g], sketch_starts[g + 1])
+                totals.hit_sizes.add_counts(
+                    zip(sketch_buckets[bucket_range].tolist(), sketch_counts[bucket_range].tolist()), biggest_hit[g]
+                )
+                rows = order[group_starts[g] : group_starts[g + 1]]
+                if len(rows) > 0:
+                    totals.add_buckets(np.bincount(time_bucket[rows], weights=damage[rows]))
+
+        source_key = hits.player[dealt].astype(np.int64) * len(self.names.names) + hits.source[dealt]
+        keys, source_index = np.unique(source_key, return_inverse=True)
+        for key, value in zip(keys.tolist(), np.bincount(source_index, weights=damage).tolist()):
+            source = divmod(key, len(self.names.names))
+            self.sources[source] = self.sources.get(source, 0) + value
+
+    def finish_encounter(self) -> None:
+        """Reduces the current encounter to its summary and adds it to the totals"""
+        encounter = self.current
+        if encounter is None:
+            return
+        self.current = None
+        duration = encounter.duration
+        for player, totals in encounter.players.items():
+            totals.window_dps = [
+                peak_window_dps(totals.buckets, window, duration) for window in columns.DPS_WINDOWS.values()
+            ]
+            totals.buckets = np.zeros(0)
+
+            overall = self.totals.get(player)
+            if overall is None:
+                overall = self.totals[player] = PlayerTotals()
+            overall.damage += totals.damage
+            overall.taken += totals.taken
+            overall.hits += totals.hits
+            overall.hit_sizes.merge(totals.hit_sizes)
+            overall.window_dps = [max(a, b) for a, b in zip(overall.window_dps, totals.window_dps)]
+        self.duration += duration
+        self.encounters.append(self.summary(encounter.players, duration))
+
+    def summary(self, players: dict[int, PlayerTotals], duration: float) -> dict:
+        party_damage = sum(totals.damage for totals in players.values())
+        player_stats = {}
+        for player, totals in sorted(players.items()):
+            if totals.hits == 0 and totals.taken == 0:
+                continue
+            values = {
+                columns.ColumnType.DPS: columns.average_dps(totals.damage, duration),
+                columns.ColumnType.BIGGEST_HIT: totals.hit_sizes.max,
+                columns.ColumnType.DAMAGE: totals.damage,
+                columns.ColumnType.PARTY_PERCENT: totals.damage / party_damage * 100 if party_damage > 0 else 0,
+                columns.ColumnType.DAMAGE_TAKEN: totals.taken,
+            }
+            values.update(zip(columns.DPS_WINDOWS, totals.window_dps))
+            values.update((column, totals.hit_sizes.quantile(q)) for column, q in columns.HIT_QUANTILES.items())
+            player_stats[self.names.names[player]] = {
+                column.value: float(values[column]) for column in columns.COLUMNS
+            } | {"hits": totals.hits}
+        return {"duration": float(duration), "players": player_stats}
+
+    def result(self, shown_sources: int) -> dict:
+        self.finish_encounter()
+        total = self.summary(self.totals, self.duration)
+        total["sources"] = {
+            self.names.names[player]: [
+                {"name": self.names.names[source], "damage": value}
+                for (source_player, source), value in sorted(
+                    self.sources.items(), key=lambda item: item[1], reverse=True
+                )
+                if source_player == player
+            ][:shown_sources]
+            for player in sorted(self.totals)
+        }
+        return {"encounters": self.encounters, "total": total}
+
+
+def analyse(segments: list[Path], names: Names, timeout: float, include_overkill: bool, shown_sources: int) -> dict:
+    analysis = LogAnalysis(names, timeout, include_overkill)
+    previous_log = None
+    for segment in segments:
+        # only one segment is read at a time, its columns are dropped once they are added up
+        analysis.add_segment(segment_hits(read_segment(segment), names, log_name(segment) != previous_log))
+        previous_log = log_name(segment)
+    return analysis.result(shown_sources)
+
+
+def format_table(title: str, summary: dict) -> str:
+    minutes, seconds = divmod(int(summary["duration"]), 60)
+    lines = [f"{title} ({minutes}:{seconds:02})"]
+    header = ["Name"] + [column.value for column in columns.COLUMNS]
+    rows = [header]
+    for player_name, stats in sorted(
+        summary["players"].items(), key=lambda item: item[1][columns.ColumnType.DAMAGE.value], reverse=True
+    ):
+        rows.append(
+            [player_name]
+            + [
+                (
+                    f"{stats[column.value]:.1f}%"
+                    if column is columns.ColumnType.PARTY_PERCENT
+                    else columns.human_format(stats[column.value])
+                )
+                for column in columns.COLUMNS
+            ]
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    for row in rows:
+        lines.append(
+            "  ".join(
+                cell.ljust(width) if i == 0 else cell.rjust(width) for i, (cell, width) in enumerate(zip(row, widths))
+            )
+        )
+    for player_name, sources in summary.get("sources", {}).items():
+        lines.append(
+            f"{player_name}: "
+            + ", ".join(f"{source['name']} {columns.human_format(source['damage'])}" for source in sources)
+        )
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Analyse damage meter combat logs")
+    parser.add_argument("paths", nargs="+", type=Path, help="log segments or directories containing them")
+    parser.add_argument("--no-overkill", action="store_true", help="don't include overkill damage")
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_ENCOUNTER_TIMEOUT,
+        help="seconds without damage after which the next damage starts a new encounter",
+    )
+    parser.add_argument("--sources", type=int, default=3, help="number of damage sources to show per player")
+    parser.add_argument("--json", action="store_true", help="print the stats as json")
+    args = parser.parse_args(argv)
+
+    names = Names()
+    result = analyse(find_segments(args.paths), names, args.timeout, not args.no_overkill, args.sources)
+
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        return 0
+
+    for number, summary in enumerate(result["encounters"], start=1):
+        print(format_table(f"#{number} Fight", summary), end="\n\n")
+    print(format_table("All Encounters", result["total"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
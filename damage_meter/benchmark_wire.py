@@ -0,0 +1,82 @@
+"""
+Compares the compact network format with json, runs outside of the game.
+
+    python benchmark_wire.py [player counts...]
+
+For every lobby size it prints the size of a full message (join/resync) and of a typical delta while everyone is
+shooting, plus the time to encode and decode them.
+"""
+
+from __future__ import annotations
+import json
+import random
+import sys
+import timeit
+
+from offline import load_pure_modules
+
+sync, wire = load_pure_modules("sync", "wire")
+
+CLASSES = ("Soldier", "Siren", "Hunter", "Gunzerker", "Mechromancer", "Psycho")
+
+
+def random_stats(number: int) -> dict:
+    damage = random.randint(10**6, 10**10)
+    return {
+        "number": number,
+        "character_class": CLASSES[number % len(CLASSES)],
+        "damage": damage,
+        "flesh_damage": damage // 2,
+        "shield_damage": damage // 4,
+        "overkill_damage": damage // 10,
+        "damage_taken": random.randint(0, 10**7),
+        "hits": random.randint(100, 10**5),
+        "dps": random.random() * 10**7,
+        "window_dps": [random.random() * 10**7, random.random() * 10**7],
+        "biggest_hit": random.random() * 10**8,
+        "hit_quantiles": [random.random() * 10**6, random.random() * 10**7, random.random() * 10**8],
+        "start_epoch": random.random() * 10**4,
+    }
+
+
+def shoot(stats: dict) -> dict:
+    # what changes between two updates while everyone is shooting
+    damage = stats["damage"] + random.randint(10**4, 10**6)
+    return {
+        **stats,
+        "damage": damage,
+        "flesh_damage": damage // 2,
+        "hits": stats["hits"] + random.randint(1, 20),
+        "dps": random.random() * 10**7,
+        "window_dps": [random.random() * 10**7, random.random() * 10**7],
+        "hit_quantiles": [stats["hit_quantiles"][0], random.random() * 10**7, stats["hit_quantiles"][2]],
+    }
+
+
+def benchmark(players: int) -> None:
+    base = {f"Player {number}": random_stats(number) for number in range(players)}
+    current = {player_name: shoot(stats) for player_name, stats in base.items()}
+    host = sync.SyncHost()
+    full = host.message_for("Client", 1, base)
+    host.acknowledge("Client", 1)
+    delta = host.message_for("Client", 2, current)
+
+    print(f"{players} players")
+    for label, message, stats, base_stats in (("full", full, base, {}), ("delta", delta, current, base)):
+        as_json = json.dumps(message)
+        compact = wire.encode_message(message, stats, base_stats)
+        json_time = timeit.timeit(lambda: json.loads(json.dumps(message)), number=1000)
+        compact_time = timeit.timeit(
+            lambda: wire.decode_message(wire.encode_message(message, stats, base_stats), {1: base}.get), number=1000
+        )
+        print(
+            f"  {label:5}  json {len(as_json):5} B {json_time * 1000:6.1f} µs"
+            f"  compact {len(compact):5} B {compact_time * 1000:6.1f} µs"
+            f"  ({len(compact) / len(as_json):.0%} of the size)"
+        )
+
+
+if __name__ == "__main__":
+    random.seed(0)
+    for players in [int(arg) for arg in sys.argv[1:]] or [4, 8, 16]:
+        benchmark(players)
@@ -0,0 +1,73 @@
+from __future__ import annotations
+from collections import OrderedDict
+from enum import Enum
+
+# only the standard library, the offline log analysis uses the same definitions as the meter
+
+
+class ColumnType(str, Enum):
+    PARTY_PERCENT = "Party%"
+    DAMAGE = "Dmg"
+    DPS = "DPS"
+    DPS_SHORT = "5s DPS"
+    DPS_LONG = "30s DPS"
+    DAMAGE_TAKEN = "Taken"
+    BIGGEST_HIT = "Max Hit"
+    HIT_P50 = "p50 Hit"
+    HIT_P95 = "p95 Hit"
+    HIT_P99 = "p99 Hit"
+
+
+# order of the columns from left to right
+COLUMNS: tuple[ColumnType, ...] = (
+    ColumnType.DPS_SHORT,
+    ColumnType.DPS_LONG,
+    ColumnType.DPS,
+    ColumnType.HIT_P50,
+    ColumnType.HIT_P95,
+    ColumnType.HIT_P99,
+    ColumnType.BIGGEST_HIT,
+    ColumnType.DAMAGE,
+    ColumnType.PARTY_PERCENT,
+    ColumnType.DAMAGE_TAKEN,
+)
+
+# windows in seconds of the rolling DPS columns, whole session DPS is the plain DPS column
+DPS_WINDOWS: dict[ColumnType, float] = OrderedDict(
+    [
+        (ColumnType.DPS_SHORT, 5),
+        (ColumnType.DPS_LONG, 30),
+    ]
+)
+
+# quantiles of the hit size columns
+HIT_QUANTILES: dict[ColumnType, float] = OrderedDict(
+    [
+        (ColumnType.HIT_P50, 0.5),
+        (ColumnType.HIT_P95, 0.95),
+        (ColumnType.HIT_P99, 0.99),
+    ]
+)
+
+
+def damage_dealt(flesh, shield, overkill, include_overkill: bool):
+    """Damage of a hit or a total, works the same on plain numbers and numpy arrays"""
+    damage = flesh + shield
+    if not include_overkill:
+        damage = damage - overkill
+    return damage
+
+
+def average_dps(damage, seconds):
+    # +1 so the first second does not show huge numbers
+    return damage / (seconds + 1)
+
+
+# straight from SO @rtaft https://stackoverflow.com/a/45846841
+def human_format(num: float) -> str:
+    num = float("{:.3g}".format(num))
+    magnitude = 0
+    while abs(num) >= 1000:
+        magnitude += 1
+        num /= 1000.0
+    return "{}{}".format("{:f}".format(num).rstrip("0").rstrip("."), ["", "K", "M", "B", "T", "Q", "E"][magnitude])
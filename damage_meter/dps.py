@@ -0,0 +1,70 @@
+from __future__ import annotations
+from array import array
+from math import ceil
+
+BUCKET_WIDTH = 0.5
+
+
+class RollingDps:
+    """
+    Damage of a single player in fixed width time buckets, stored in a ring buffer.
+
+    A running sum is kept for every window, so adding damage and reading a window are O(1)
+    and moving time forward is O(1) per passed bucket. Memory only depends on the longest window.
+    """
+
+    __slots__ = ("bucket_width", "windows", "spans", "buckets", "sums", "head", "head_epoch", "start_epoch")
+
+    def __init__(self, windows: tuple[float, ...], epoch: float, bucket_width: float = BUCKET_WIDTH) -> None:
+        self.bucket_width = bucket_width
+        self.windows = windows
+        # number of buckets (including the current one) covered by each window
+        self.spans = [max(ceil(window / bucket_width), 1) for window in windows]
+        self.buckets = array("d", [0]) * max(self.spans, default=1)
+        self.sums = array("d", [0]) * len(windows)
+        self.head = 0
+        self.head_epoch = epoch
+        self.start_epoch = epoch
+
+    def advance(self, epoch: float) -> None:
+        """Moves the current bucket forward to the given time, dropping buckets that fell out of a window"""
+        steps = int((epoch - self.head_epoch) // self.bucket_width)
+        if steps <= 0:
+            return
+        self.head_epoch += steps * self.bucket_width
+
+        size = len(self.buckets)
+        # everything is outdated, no need to walk the ring
+        if steps >= size:
+            self.buckets = array("d", [0]) * size
+            self.sums = array("d", [0]) * len(self.windows)
+            self.head = 0
+            return
+
+        buckets, sums, spans = self.buckets, self.sums, self.spans
+        for _ in range(steps):
+            head = (self.head + 1) % size
+            self.head = head
+            for i, span in enumerate(spans):
+                sums[i] -= buckets[(head - span) % size]
+            buckets[head] = 0
+
+    def add(self, epoch: float, damage: float) -> None:
+        self.advance(epoch)
+        self.buckets[self.head] += damage
+        sums = self.sums
+        for i in range(len(sums)):
+            sums[i] += damage
+
+    def shift(self, seconds: float) -> None:
+        """Moves the time of all buckets, e.g. to skip the time the meter was paused"""
+        self.head_epoch += seconds
+        self.start_epoch += seconds
+
+    def dps(self, window_index: int, epoch: float) -> float:
+        """The damage per second in the window, only counting the time since the first bucket if it is shorter"""
+        self.advance(epoch)
+        current_bucket_time = epoch - self.head_epoch
+        covered = (self.spans[window_index] - 1) * self.bucket_width + current_bucket_time
+        covered = min(covered, epoch - self.start_epoch)
+        return max(self.sums[window_index], 0) / max(covered, self.bucket_width)
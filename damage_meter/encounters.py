@@ -0,0 +1,46 @@
+from __future__ import annotations
+from collections import deque
+from typing import Mapping, NamedTuple
+from .snapshot import PlayerStats
+
+DEFAULT_CAPACITY = 20
+
+
+class EncounterSummary(NamedTuple):
+    number: int
+    duration: float
+    # name of the boss whose death ended the encounter
+    boss: str | None
+    # the published stats at the end of the encounter, these are immutable and can be shared
+    player_stats: Mapping[str, PlayerStats]
+
+    @property
+    def label(self) -> str:
+        minutes, seconds = divmod(int(self.duration), 60)
+        return f"#{self.number} {self.boss or 'Fight'} ({minutes}:{seconds:02})"
+
+
+class EncounterHistory:
+    """Fixed capacity ring of the most recent finished encounters, older ones get dropped"""
+
+    __slots__ = ("summaries", "count")
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY) -> None:
+        self.summaries: deque[EncounterSummary] = deque(maxlen=capacity)
+        # number of encounters ever finished, used to number them
+        self.count = 0
+
+    def __len__(self) -> int:
+        return len(self.summaries)
+
+    def add(self, duration: float, boss: str | None, player_stats: Mapping[str, PlayerStats]) -> EncounterSummary:
+        self.count += 1
+        summary = EncounterSummary(self.count, duration, boss, player_stats)
+        self.summaries.append(summary)
+        return summary
+
+    def get(self, encounters_back: int) -> EncounterSummary | None:
+        """The finished encounter the given number of encounters ago, 1 being the most recent one"""
+        if not 0 < encounters_back <= len(self.summaries):
+            return None
+        return self.summaries[-encounters_back]
@@ -0,0 +1,164 @@
+from __future__ import annotations
+from collections import OrderedDict, deque
+from typing import Callable, Hashable, NamedTuple, cast
+from .hits import HitBuffer
+
+# hard cap of enemies tracked at the same time, the least recently hit one gets dropped first
+MAX_TRACKED_ENEMIES = 256
+# enemies not hit for this long are dropped without counting as a kill
+INACTIVITY_TIMEOUT = 30.0
+# anything that took at least this long to kill gets a per player breakdown, which includes all bosses
+BOSS_MIN_TIME_TO_KILL = 10.0
+MAX_RECENT_BOSS_KILLS = 10
+MAX_TRACKED_BOSSES = 32
+
+
+class EnemyEntry:
+    __slots__ = ("pointer", "name", "first_hit_epoch", "last_hit_epoch", "kill_epoch", "damage")
+
+    def __init__(self, pointer: Callable[[], object], name: str, epoch: float) -> None:
+        # None once the enemy is gone, a new one can end up at the same address and compare equal
+        self.pointer = pointer
+        self.name = name
+        self.first_hit_epoch = epoch
+        self.last_hit_epoch = epoch
+        self.kill_epoch: float | None = None
+        # player name -> damage
+        self.damage: dict[str, float] = {}
+
+
+class BossKill(NamedTuple):
+    name: str
+    time_to_kill: float
+    damage: dict[str, float]
+
+
+class BossStats:
+    __slots__ = ("kills", "total_time_to_kill", "fastest_kill", "damage")
+
+    def __init__(self) -> None:
+        self.kills = 0
+        self.total_time_to_kill = 0.0
+        self.fastest_kill = float("inf")
+        # player name -> damage over all kills
+        self.damage: dict[str, float] = {}
+
+    @property
+    def average_time_to_kill(self) -> float:
+        return self.total_time_to_kill / self.kills if self.kills > 0 else 0
+
+
+class EnemyTable:
+    """
+    Damage per enemy, keyed by the damaged pawn.
+
+    Enemies are dropped as soon as they die, after being inactive for a while or when too many are tracked,
+    so memory stays the same no matter how many enemies get killed. Kills only leave behind the time to kill
+    aggregate and, if they took long enough, a per player breakdown.
+    """
+
+    __slots__ = ("get_name", "get_pointer", "entries", "kills", "total_time_to_kill", "recent_boss_kills", "bosses")
+
+    def __init__(
+        self, get_name: Callable[[Hashable], str], get_pointer: Callable[[Hashable], Callable[[], object]]
+    ) -> None:
+        # both only called once per enemy, the first time it gets hit
+        self.get_name = get_name
+        self.get_pointer = get_pointer
+        self.entries: OrderedDict[Hashable, EnemyEntry] = OrderedDict()
+
+        self.kills = 0
+        self.total_time_to_kill = 0.0
+        self.recent_boss_kills: deque[BossKill] = deque(maxlen=MAX_RECENT_BOSS_KILLS)
+        self.bosses: OrderedDict[str, BossStats] = OrderedDict()
+
+    @property
+    def average_time_to_kill(self) -> float:
+        return self.total_time_to_kill / self.kills if self.kills > 0 else 0
+
+    def clear(self) -> None:
+        """Drops the tracked enemies without counting them, e.g. after a map load, the kill stats are kept"""
+        self.entries.clear()
+
+    def add_hits(
+        self,
+        hits: HitBuffer,
+        epoch: float,
+        player_names: dict[int, str],
+        include_overkill: bool,
+    ) -> list[BossKill]:
+        """Adds all hits of the buffer to the enemies they hit, without clearing the buffer. Returns the killed bosses"""
+        entries = self.entries
+        killed: list[Hashable] = []
+        for i in range(hits.size):
+            player_name = player_names.get(hits.slots[i])
+            previous_health = hits.health[i]
+            # player disconnected since the hit or the enemy already died in an earlier tick
+            if player_name is None or previous_health <= 0:
+                continue
+
+            target = hits.targets[i]
+            entry = entries.get(target)
+            # only checked once per drain, like moving it to the end
+            if entry is not None and entry.last_hit_epoch != epoch and entry.pointer() is None:
+                del entries[target]
+                entry = None
+            if entry is None:
+                entry = entries[target] = EnemyEntry(self.get_pointer(target), self.get_name(target), epoch)
+                if len(entries) > MAX_TRACKED_ENEMIES:
+                    entries.popitem(last=False)
+            elif entry.last_hit_epoch != epoch:
+                entry.last_hit_epoch = epoch
+                entries.move_to_end(target)
+
+            flesh = hits.flesh[i]
+            damage = flesh + hits.shield[i]
+            if not include_overkill:
+                damage -= hits.overkill[i]
+            entry.damage[player_name] = entry.damage.get(player_name, 0) + damage
+
+            if flesh >= previous_health and entry.kill_epoch is None:
+                entry.kill_epoch = epoch
+                killed.append(target)
+
+        boss_kills: list[BossKill] = []
+        for target in killed:
+            entry = entries.pop(target, None)
+            # could have been dropped by the cap in the meantime
+            if entry is None:
+                continue
+            boss_kill = self._finish_kill(entry)
+            if boss_kill is not None:
+                boss_kills.append(boss_kill)
+        return boss_kills
+
+    def evict_inactive(self, epoch: float) -> None:
+        entries = self.entries
+        # least recently hit enemies are always at the front
+        while entries:
+            target, entry = next(iter(entries.items()))
+            if epoch - entry.last_hit_epoch < INACTIVITY_TIMEOUT:
+                break
+            del entries[target]
+
+    def _finish_kill(self, entry: EnemyEntry) -> BossKill | None:
+        time_to_kill = cast(float, entry.kill_epoch) - entry.first_hit_epoch
+        self.kills += 1
+        self.total_time_to_kill += time_to_kill
+        if time_to_kill < BOSS_MIN_TIME_TO_KILL:
+            return None
+
+        boss_kill = BossKill(entry.name, time_to_kill, entry.damage)
+        self.recent_boss_kills.append(boss_kill)
+
+        boss = self.bosses.pop(entry.name, None) or BossStats()
+        boss.kills += 1
+        boss.total_time_to_kill += time_to_kill
+        boss.fastest_kill = min(boss.fastest_kill, time_to_kill)
+        for player_name, damage in entry.damage.items():
+            boss.damage[player_name] = boss.damage.get(player_name, 0) + damage
+        # most recently killed boss at the end, drop the one not seen for the longest time
+        self.bosses[entry.name] = boss
+        if len(self.bosses) > MAX_TRACKED_BOSSES:
+            self.bosses.popitem(last=False)
+        return boss_kill
@@ -0,0 +1,55 @@
+from __future__ import annotations
+from array import array
+from typing import Hashable
+
+# big enough to hold a few ticks of shotgun/DOT spam without ever draining inside the hook
+DEFAULT_CAPACITY = 2048
+
+
+class HitBuffer:
+    """
+    Preallocated buffer of raw hits.
+
+    The damage hook only appends to it, the tick coroutine drains it into the stats once per tick.
+    Records are stored column wise in fixed size arrays, so appending never allocates.
+    """
+
+    __slots__ = ("capacity", "size", "slots", "flesh", "shield", "overkill", "health", "targets", "sources")
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY) -> None:
+        self.capacity = capacity
+        self.size = 0
+        self.slots = array("i", [0]) * capacity
+        self.flesh = array("d", [0]) * capacity
+        self.shield = array("d", [0]) * capacity
+        self.overkill = array("d", [0]) * capacity
+        # health of the target before the hit
+        self.health = array("d", [0]) * capacity
+        self.targets: list[Hashable] = [None] * capacity
+        # what caused the damage, the weapon for projectiles, grenade, action skill, ...
+        self.sources: list[Hashable] = [None] * capacity
+
+    def append(
+        self,
+        slot: int,
+        flesh: float,
+        shield: float,
+        overkill: float,
+        health: float,
+        target: Hashable,
+        source: Hashable,
+    ) -> bool:
+        """Adds a hit to the buffer. Returns True if the buffer is full and has to be drained"""
+        i = self.size
+        self.slots[i] = slot
+        self.flesh[i] = flesh
+        self.shield[i] = shield
+        self.overkill[i] = overkill
+        self.health[i] = health
+        self.targets[i] = target
+        self.sources[i] = source
+        self.size = i + 1
+        return self.size == self.capacity
+
+    def clear(self) -> None:
+        self.size = 0
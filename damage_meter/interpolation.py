@@ -0,0 +1,114 @@
+from __future__ import annotations
+from typing import Mapping
+from .snapshot import PlayerStats, StatsSnapshot
+
+# fields that change continuously while fighting, everything else is shown as received
+SMOOTHED_FIELDS = ("damage", "flesh_damage", "shield_damage", "overkill_damage", "damage_taken", "dps")
+SMOOTHED_LIST_FIELDS = ("window_dps",)
+# never extrapolate further than this past the last update, also capped at the time between the last two updates
+MAX_EXTRAPOLATION = 5.0
+# how long it takes to blend out the difference between the shown and the received values
+CORRECTION_TIME = 0.3
+# how long it takes to go back to the received values once the next update is overdue, e.g. the fight ended
+RETURN_TIME = 1.0
+
+
+def extrapolate(previous: float, current: float, elapsed: float, horizon: float) -> float:
+    # horizon is the time between the two values
+    if horizon <= 0:
+        return current
+    limit = min(horizon, MAX_EXTRAPOLATION)
+    if elapsed <= limit:
+        return current + (current - previous) * elapsed / horizon
+    # the host only sends something once the stats change, so nothing coming means they stopped changing
+    return current + (current - previous) * limit / horizon * max(1 - (elapsed - limit) / RETURN_TIME, 0)
+
+
+class StatsInterpolator:
+    """
+    Smooths the stats shown on clients between two updates of the host.
+
+    The continuously changing values keep moving at the rate between the last two updates, for at most as long as
+    those two were apart, so the error is bounded by how much they changed between them. Once the next update
+    arrives the remaining difference is blended out instead of jumping. If it does not arrive in time the values
+    go back to the last received ones, so the overshoot never stays.
+
+    Times are from a monotonic clock, the world time starts over on a map load.
+    """
+
+    __slots__ = (
+        "version",
+        "previous",
+        "current",
+        "previous_epoch",
+        "current_epoch",
+        "shown",
+        "corrections",
+        "settled",
+    )
+
+    def __init__(self) -> None:
+        self.version = -1
+        self.previous: Mapping[str, PlayerStats] = {}
+        self.current: Mapping[str, PlayerStats] = {}
+        self.previous_epoch = 0.0
+        self.current_epoch = 0.0
+        # what was shown last frame, to correct from
+        self.shown: dict[str, PlayerStats] = {}
+        # difference between shown and received per player and field, blended out over CORRECTION_TIME
+        self.corrections: dict[str, dict[str, float]] = {}
+        # nothing moves until the next update anymore, so the same stats can be shown again
+        self.settled = False
+
+    def stats(self, snapshot: StatsSnapshot, now: float) -> dict[str, PlayerStats]:
+        if snapshot.version != self.version:
+            self._receive(snapshot, now)
+        elif self.settled:
+            return self.shown
+
+        elapsed = now - self.current_epoch
+        horizon = self.current_epoch - self.previous_epoch
+        blend = max(1 - elapsed / CORRECTION_TIME, 0)
+        shown: dict[str, PlayerStats] = {}
+        for player_name, stats in self.current.items():
+            previous = self.previous.get(player_name)
+            # a reset (e.g. a new encounter) is not something to extrapolate
+            if previous is None or previous["damage"] > stats["damage"]:
+                shown[player_name] = stats
+                continue
+
+            corrections = self.corrections.get(player_name, {}) if blend > 0 else {}
+            smoothed = stats.copy()
+            for field in SMOOTHED_FIELDS:
+                value = extrapolate(previous[field], stats[field], elapsed, horizon)  # type: ignore
+                smoothed[field] = value + corrections.get(field, 0) * blend  # type: ignore
+            for field in SMOOTHED_LIST_FIELDS:
+                smoothed[field] = [  # type: ignore
+                    extrapolate(previous_value, value, elapsed, horizon) + corrections.get(f"{field}{i}", 0) * blend
+                    for i, (previous_value, value) in enumerate(zip(previous[field], stats[field]))  # type: ignore
+                ]
+            shown[player_name] = smoothed
+
+        self.shown = shown
+        self.settled = blend == 0 and elapsed >= min(horizon, MAX_EXTRAPOLATION) + RETURN_TIME
+        return shown
+
+    def _receive(self, snapshot: StatsSnapshot, now: float) -> None:
+        self.version = snapshot.version
+        self.previous = self.current
+        self.previous_epoch = self.current_epoch
+        self.current = snapshot.player_stats
+        self.current_epoch = now
+        self.settled = False
+
+        self.corrections = {}
+        for player_name, stats in self.current.items():
+            shown = self.shown.get(player_name)
+            previous = self.previous.get(player_name)
+            if shown is None or previous is None or previous["damage"] > stats["damage"]:
+                continue
+            corrections = {field: shown[field] - stats[field] for field in SMOOTHED_FIELDS}  # type: ignore
+            for field in SMOOTHED_LIST_FIELDS:
+                for i, (shown_value, value) in enumerate(zip(shown[field], stats[field])):  # type: ignore
+                    corrections[f"{field}{i}"] = shown_value - value
+            self.corrections[player_name] = corrections
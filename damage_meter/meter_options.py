@@ -2,6 +2,7 @@ from collections import OrderedDict
 from enum import Enum
 from typing import TYPE_CHECKING
 from mods_base import options
+from .columns import COLUMNS, ColumnType
 
 if TYPE_CHECKING:
     from ui.options import BaseOptions
@@ -9,12 +10,6 @@ else:
     from .ui.options import BaseOptions
 
 
-class ColumnType(str, Enum):
-    PARTY_PERCENT = "Party%"
-    DAMAGE = "Dmg"
-    DPS = "DPS"
-
-
 class ColorBy(str, Enum):
     PLAYER = "Player"
     CLASS = "Class"
@@ -43,6 +38,13 @@ opt_show_class = options.BoolOption(
 )
 opt_show_class.default_value = True
 
+opt_show_graph = options.BoolOption(
+    identifier="Show DPS Graph",
+    value=False,
+    description="Whether to show a graph of the DPS of each player over the current encounter or not",
+)
+opt_show_graph.default_value = False
+
 opt_show_dps = options.BoolOption(
     identifier="Show DPS",
     value=True,
@@ -50,6 +52,34 @@ opt_show_dps = options.BoolOption(
 )
 opt_show_dps.default_value = True
 
+opt_show_dps_short = options.BoolOption(
+    identifier="Show 5s DPS",
+    value=False,
+    description="Whether to show the DPS of the last 5 seconds or not",
+)
+opt_show_dps_short.default_value = False
+
+opt_show_dps_long = options.BoolOption(
+    identifier="Show 30s DPS",
+    value=False,
+    description="Whether to show the DPS of the last 30 seconds or not",
+)
+opt_show_dps_long.default_value = False
+
+opt_show_biggest_hit = options.BoolOption(
+    identifier="Show Biggest Hit",
+    value=False,
+    description="Whether to show the biggest single hit of each player or not",
+)
+opt_show_biggest_hit.default_value = False
+
+opt_show_hit_quantiles = options.BoolOption(
+    identifier="Show Hit Sizes",
+    value=False,
+    description="Whether to show the typical hit sizes or not. p50 is the median hit, p95 and p99 are bigger than 95% and 99% of all hits.",
+)
+opt_show_hit_quantiles.default_value = False
+
 opt_show_total_dmg = options.BoolOption(
     identifier="Show Total Damage",
     value=True,
@@ -64,18 +94,44 @@ opt_show_party_percent = options.BoolOption(
 )
 opt_show_party_percent.default_value = True
 
-
+opt_show_damage_taken = options.BoolOption(
+    identifier="Show Damage Taken",
+    value=False,
+    description="Whether to show the damage taken column or not",
+)
+opt_show_damage_taken.default_value = False
+
+
+COLUMN_OPTIONS: dict[ColumnType, options.BoolOption] = {
+    ColumnType.DPS_SHORT: opt_show_dps_short,
+    ColumnType.DPS_LONG: opt_show_dps_long,
+    ColumnType.DPS: opt_show_dps,
+    ColumnType.HIT_P50: opt_show_hit_quantiles,
+    ColumnType.HIT_P95: opt_show_hit_quantiles,
+    ColumnType.HIT_P99: opt_show_hit_quantiles,
+    ColumnType.BIGGEST_HIT: opt_show_biggest_hit,
+    ColumnType.DAMAGE: opt_show_total_dmg,
+    ColumnType.PARTY_PERCENT: opt_show_party_percent,
+    ColumnType.DAMAGE_TAKEN: opt_show_damage_taken,
+}
+
+# drawn from the right edge of the meter, so right to left
 RHS_COLUMNS: dict[ColumnType, options.BoolOption] = OrderedDict(
-    [
-        (ColumnType.PARTY_PERCENT, opt_show_party_percent),
-        (ColumnType.DAMAGE, opt_show_total_dmg),
-        (ColumnType.DPS, opt_show_dps),
-    ]
+    (column, COLUMN_OPTIONS[column]) for column in reversed(COLUMNS)
 )
 
 opt_grp_columns = options.GroupedOption(
     identifier="Columns",
-    children=[opt_show_dps, opt_show_total_dmg, opt_show_party_percent],
+    children=[
+        opt_show_dps_short,
+        opt_show_dps_long,
+        opt_show_dps,
+        opt_show_hit_quantiles,
+        opt_show_biggest_hit,
+        opt_show_total_dmg,
+        opt_show_party_percent,
+        opt_show_damage_taken,
+    ],
     description="Which columns to show in the damage meter",
 )
 
@@ -84,12 +140,14 @@ class MeterOptions(BaseOptions):
     COLORED_BY = "Colored By"
     SHOW_BARS = "Show Bars"
     SHOW_CLASS = "Show Class"
+    SHOW_GRAPH = "Show DPS Graph"
     COLUMN_OPTS = "Columns"
 
     _extended_options = {
         COLORED_BY: opt_color_by,
         SHOW_BARS: opt_show_bars,
         SHOW_CLASS: opt_show_class,
+        SHOW_GRAPH: opt_show_graph,
         COLUMN_OPTS: opt_grp_columns,
     }
     _options = {**BaseOptions._options, **_extended_options}
@@ -0,0 +1,21 @@
+"""Lets the scripts next to the mod use its modules that do not need the game, outside of the game"""
+
+from __future__ import annotations
+import importlib.util
+import sys
+from pathlib import Path
+from types import ModuleType
+
+PACKAGE_NAME = "damage_meter_offline"
+
+
+def load_pure_modules(*names: str) -> list[ModuleType]:
+    # the modules use relative imports, so they need a package, but not the __init__ that needs the game
+    package = sys.modules.get(PACKAGE_NAME)
+    if package is None:
+        spec = importlib.util.spec_from_loader(PACKAGE_NAME, loader=None, is_package=True)
+        assert spec is not None
+        package = importlib.util.module_from_spec(spec)
+        package.__path__ = [str(Path(__file__).parent)]
+        sys.modules[PACKAGE_NAME] = package
+    return [importlib.import_module(f".{name}", PACKAGE_NAME) for name in names]
@@ -0,0 +1,153 @@
+"""
+Keeps the stats of the current encounter on disk, so they survive reloading the map or a crash of the game.
+
+The stats are stored as a snapshot file plus an append-only journal of the fields that changed since the last
+write, one json line per write. Every write is a single small sequential append. Once the journal grows past
+COMPACT_SIZE the current state gets written as a new snapshot and the journal starts over. Both carry a sequence
+number, so journal lines that were already compacted into the snapshot are skipped if the game crashed in between.
+A line cut off by a crash is simply where the replay stops. Every write also carries the wall clock time, stats
+last written longer than STALE_AFTER ago belong to an earlier session and are not restored.
+"""
+
+from __future__ import annotations
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Mapping
+from .snapshot import PlayerStats
+
+SNAPSHOT_FILE = "stats.json"
+JOURNAL_FILE = "stats.journal"
+
+# seconds between two writes
+WRITE_INTERVAL = 1.0
+COMPACT_SIZE = 256 * 1024
+# seconds since the last write after which the stats are from an earlier session rather than a reload or crash
+STALE_AFTER = 10 * 60
+
+
+class PersistedStats(PlayerStats):
+    # world time the stats were written at, the world time starts over after a reload, so only the time between
+    # start_epoch and this is meaningful
+    epoch: float
+
+
+class StatsJournal:
+    """
+    Persisted stats of all players of the current encounter.
+
+    Players that leave are kept until the encounter is finished, so they get their stats back if they rejoin after
+    a reload.
+    """
+
+    __slots__ = ("directory", "stats", "sequence", "_journal", "_journal_size", "_compact")
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.stats: dict[str, PersistedStats] = {}
+        self.sequence = 0
+        self._journal = None
+        self._journal_size = 0
+        self._compact = False
+
+    def load(self) -> None:
+        """Replays the snapshot and the journal, anything unreadable is treated as not written"""
+        written = 0.0
+        snapshot = self._read_json(self.directory / SNAPSHOT_FILE)
+        if snapshot is not None:
+            self.stats = snapshot["stats"]
+            self.sequence = snapshot["sequence"]
+            written = snapshot.get("written", 0.0)
+
+        try:
+            with (self.directory / JOURNAL_FILE).open("rb") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    if entry["sequence"] <= self.sequence:
+                        continue
+                    for player_name, fields in entry["changed"].items():
+                        stats = self.stats.get(player_name)
+                        self.stats[player_name] = fields if stats is None else {**stats, **fields}
+                    self.sequence = entry["sequence"]
+                    written = entry.get("written", written)
+        except OSError:
+            pass
+        if time.time() - written > STALE_AFTER:
+            self.stats = {}
+        # start over with a new snapshot, so new lines never end up behind one that got cut off
+        self._compact = True
+
+    def write(self, player_stats: Mapping[str, PlayerStats], epoch: float) -> int:
+        """Persists the changes since the last write, returns the number of bytes written"""
+        changed: dict[str, dict[str, Any]] = {}
+        for player_name, stats in player_stats.items():
+            persisted = self.stats.get(player_name)
+            if persisted is None:
+                fields = dict(stats)
+            else:
+                fields = {field: value for field, value in stats.items() if persisted.get(field) != value}
+                if not fields:
+                    continue
+            fields["epoch"] = epoch
+            self.stats[player_name] = fields if persisted is None else {**persisted, **fields}  # type: ignore
+            changed[player_name] = fields
+        if not changed and not self._compact:
+            return 0
+        self.sequence += 1
+
+        if self._compact or self._journal_size >= COMPACT_SIZE:
+            return self._write_snapshot()
+
+        journal = self._journal
+        if journal is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            journal = self._journal = (self.directory / JOURNAL_FILE).open("ab")
+            self._journal_size = journal.tell()
+        line = json.dumps({"sequence": self.sequence, "written": time.time(), "changed": changed}).encode() + b"\n"
+        journal.write(line)
+        journal.flush()
+        self._journal_size += len(line)
+        return len(line)
+
+    def forget(self) -> None:
+        """Drops the stats of everyone, e.g. when a new encounter starts, the next write starts a new snapshot"""
+        self.stats = {}
+        self._compact = True
+
+    def clear(self) -> None:
+        """Forgets the stats and writes that right away, e.g. when the session ends cleanly"""
+        self.forget()
+        self.write({}, 0.0)
+
+    def close(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _write_snapshot(self) -> int:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        data = json.dumps({"sequence": self.sequence, "written": time.time(), "stats": self.stats}).encode()
+        # write a new file and swap it in, so there always is a complete snapshot
+        temporary = self.directory / (SNAPSHOT_FILE + ".tmp")
+        with temporary.open("wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.directory / SNAPSHOT_FILE)
+
+        self.close()
+        self._journal = (self.directory / JOURNAL_FILE).open("wb")
+        self._journal_size = 0
+        self._compact = False
+        return len(data)
+
+    @staticmethod
+    def _read_json(path: Path) -> Any:
+        try:
+            return json.loads(path.read_bytes())
+        except (OSError, ValueError):
+            return None
@@ -0,0 +1,78 @@
+from __future__ import annotations
+from array import array
+from math import ceil, log
+from typing import Iterable
+
+# estimated quantiles are within 2% of the real hit size
+RELATIVE_ACCURACY = 0.02
+# hits above this all end up in the last bucket, the biggest hit is still exact
+MAX_HIT_SIZE = 1e13
+
+
+class HitSizeSketch:
+    """
+    Streaming quantiles of hit sizes in logarithmic buckets (DDSketch style).
+
+    Adding a hit is O(1), memory is fixed and two sketches with the same accuracy can be merged
+    by adding their buckets, e.g. to get the hit sizes of the whole party or of several encounters.
+    """
+
+    __slots__ = ("gamma", "log_gamma", "counts", "count", "max", "min_index", "max_index")
+
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY) -> None:
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = log(self.gamma)
+        # bucket i holds hits in (gamma^(i-1), gamma^i], everything up to 1 goes into bucket 0
+        self.counts = array("q", [0]) * (ceil(log(MAX_HIT_SIZE) / self.log_gamma) + 1)
+        self.count = 0
+        self.max = 0.0
+        # only the used range of buckets has to be walked
+        self.min_index = len(self.counts)
+        self.max_index = -1
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if value > self.max:
+            self.max = value
+        index = min(ceil(log(value) / self.log_gamma), len(self.counts) - 1) if value > 1 else 0
+        self.counts[index] += 1
+        if index < self.min_index:
+            self.min_index = index
+        if index > self.max_index:
+            self.max_index = index
+
+    def add_counts(self, counts: Iterable[tuple[int, int]], max_value: float) -> None:
+        """Adds hits already sorted into (bucket index, count), e.g. by a vectorized pass over a lot of them"""
+        for index, count in counts:
+            self.counts[index] += count
+            self.count += count
+            if index < self.min_index:
+                self.min_index = index
+            if index > self.max_index:
+                self.max_index = index
+        if max_value > self.max:
+            self.max = max_value
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0
+        rank = q * (self.count - 1)
+        counts = self.counts
+        seen = 0
+        for index in range(self.min_index, self.max_index + 1):
+            seen += counts[index]
+            if seen > rank:
+                # middle of the bucket, which keeps the relative error of both bounds
+                return min(2 * self.gamma**index / (self.gamma + 1), self.max)
+        return self.max
+
+    def merge(self, other: HitSizeSketch) -> None:
+        if other.log_gamma != self.log_gamma:
+            raise ValueError("Can only merge sketches with the same accuracy")
+        counts, other_counts = self.counts, other.counts
+        for index in range(other.min_index, other.max_index + 1):
+            counts[index] += other_counts[index]
+        self.count += other.count
+        self.max = max(self.max, other.max)
+        self.min_index = min(self.min_index, other.min_index)
+        self.max_index = max(self.max_index, other.max_index)
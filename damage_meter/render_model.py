@@ -0,0 +1,96 @@
+from __future__ import annotations
+from typing import Any, Callable, Hashable, Mapping, NamedTuple, Sequence
+from .columns import DPS_WINDOWS, HIT_QUANTILES, ColumnType, human_format
+from .snapshot import PlayerStats
+
+DPS_WINDOW_INDEX = {column: i for i, column in enumerate(DPS_WINDOWS)}
+HIT_QUANTILE_INDEX = {column: i for i, column in enumerate(HIT_QUANTILES)}
+
+
+class MeterRow(NamedTuple):
+    label: str
+    # texts of the shown columns, in the order they get drawn
+    values: tuple[str, ...]
+    # damage compared to the highest damage, the length of the bar
+    bar_fraction: float
+    # color of the bar, or of the text if bars are hidden
+    color: Any
+
+
+class RenderModel(NamedTuple):
+    """Everything the meter shows, so drawing a frame only has to issue the draw calls"""
+
+    title: str
+    column_titles: tuple[str, ...]
+    # sorted by damage dealt
+    rows: tuple[MeterRow, ...]
+
+
+def column_text(column: ColumnType, stats: PlayerStats, total_damage: int) -> str:
+    if column == ColumnType.PARTY_PERCENT:
+        return f"{stats['damage'] / total_damage if total_damage > 0 else 1:.0%}"
+    if column == ColumnType.DAMAGE:
+        return human_format(stats["damage"])
+    if column == ColumnType.DPS:
+        return human_format(stats["dps"])
+    if column == ColumnType.DAMAGE_TAKEN:
+        return human_format(stats["damage_taken"])
+    if column == ColumnType.BIGGEST_HIT:
+        return human_format(stats["biggest_hit"])
+    if column in DPS_WINDOW_INDEX:
+        return human_format(stats["window_dps"][DPS_WINDOW_INDEX[column]])
+    return human_format(stats["hit_quantiles"][HIT_QUANTILE_INDEX[column]])
+
+
+def build_render_model(
+    player_stats: Mapping[str, PlayerStats],
+    title: str,
+    columns: Sequence[ColumnType],
+    class_names: Mapping[str, str] | None,
+    get_color: Callable[[PlayerStats], Any],
+) -> RenderModel:
+    """
+    Builds the model of the meter, columns are the shown ones in drawing order.
+    class_names maps the classes to their display names, None if the class is not shown.
+    """
+    total_damage = sum(stats["damage"] for stats in player_stats.values())
+    highest_damage = max((stats["damage"] for stats in player_stats.values()), default=0)
+    rows = tuple(
+        MeterRow(
+            player_name if class_names is None else f"{player_name} - {class_names[stats['character_class']]}",
+            tuple(column_text(column, stats, total_damage) for column in columns),
+            stats["damage"] / highest_damage if highest_damage > 0 else 1,
+            get_color(stats),
+        )
+        for player_name, stats in sorted(player_stats.items(), key=lambda item: item[1]["damage"], reverse=True)
+    )
+    return RenderModel(
+        title if class_names is None else title + " - Class",
+        tuple(column.value for column in columns),
+        rows,
+    )
+
+
+class RenderModelCache:
+    """
+    Keeps the last render model until it gets asked for different stats or a different key.
+
+    Published stats are never changed, so a new version always comes as a new mapping and comparing the identity
+    is enough. The key holds everything else the model depends on, e.g. the meter options.
+    """
+
+    __slots__ = ("player_stats", "key", "model")
+
+    def __init__(self) -> None:
+        self.player_stats: Mapping[str, PlayerStats] | None = None
+        self.key: Hashable = None
+        self.model = RenderModel("", (), ())
+
+    def get(
+        self, player_stats: Mapping[str, PlayerStats], key: Hashable, build: Callable[[], RenderModel]
+    ) -> RenderModel:
+        if player_stats is not self.player_stats or key != self.key:
+            self.model = build()
+            self.player_stats = player_stats
+            self.key = key
+        return self.model
@@ -0,0 +1,76 @@
+from __future__ import annotations
+from collections import deque
+
+MIN_INTERVAL = 0.2
+MAX_INTERVAL = 5.0
+# seconds of sends the reported rates are averaged over
+RATE_WINDOW = 10.0
+
+
+class SyncScheduler:
+    """
+    Decides when the next stat sync is due.
+
+    Sends at the minimum interval while the stats keep changing and backs off exponentially while they are idle,
+    the first change after a quiet phase is sent right away again. The host upload budget is shared by all clients,
+    so with more clients every one of them gets less and syncs get spaced out until the biggest message sent to a
+    single client fits into its share.
+    """
+
+    __slots__ = (
+        "min_interval",
+        "max_interval",
+        "upload_budget",
+        "interval",
+        "last_version",
+        "next_sync",
+        "earliest_sync",
+        "_sends",
+    )
+
+    def __init__(
+        self, upload_budget: float, min_interval: float = MIN_INTERVAL, max_interval: float = MAX_INTERVAL
+    ) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # bytes per second
+        self.upload_budget = upload_budget
+        self.interval = min_interval
+        self.last_version = -1
+        # a sync is due at next_sync, or at earliest_sync if the stats changed
+        self.next_sync = 0.0
+        self.earliest_sync = 0.0
+        # (time, bytes, messages) of the recent syncs
+        self._sends: deque[tuple[float, int, int]] = deque()
+
+    def is_due(self, now: float, version: int) -> bool:
+        return now >= self.next_sync or (version != self.last_version and now >= self.earliest_sync)
+
+    def update(
+        self, now: float, version: int, sent_bytes: int, messages: int, largest_message: int, clients: int
+    ) -> None:
+        """Records a sync, which was based on the stats with the given version"""
+        if messages > 0:
+            self._sends.append((now, sent_bytes, messages))
+        while self._sends and self._sends[0][0] < now - RATE_WINDOW:
+            self._sends.popleft()
+
+        if version != self.last_version:
+            self.last_version = version
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+
+        budget_interval = 0.0
+        client_budget = self.upload_budget / max(clients, 1)
+        if client_budget > 0:
+            budget_interval = largest_message / client_budget
+        self.interval = max(self.interval, budget_interval)
+        self.next_sync = now + self.interval
+        self.earliest_sync = now + max(self.min_interval, budget_interval)
+
+    def bytes_per_second(self, now: float) -> float:
+        return sum(sent_bytes for time, sent_bytes, _ in self._sends if time >= now - RATE_WINDOW) / RATE_WINDOW
+
+    def messages_per_second(self, now: float) -> float:
+        return sum(messages for time, _, messages in self._sends if time >= now - RATE_WINDOW) / RATE_WINDOW
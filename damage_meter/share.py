@@ -0,0 +1,89 @@
+from __future__ import annotations
+import json
+from typing import Callable, Mapping, NamedTuple, TypeVar
+from .snapshot import PlayerStats, StatsSnapshot
+from .sync import RESYNC, StatsMessage, SyncClient, SyncHost
+from .wire import decode_message, encode_message
+
+# the send and receive steps of sharing the stats, without anything of the game,
+# the mod passes in its network functions and PRIs, the sync simulator its loopback network and fake ones
+
+# whatever the send function needs to reach a client, a PRI in game
+Target = TypeVar("Target")
+
+
+class SendResult(NamedTuple):
+    sent_bytes: int
+    messages: int
+    largest_message: int
+    # players without a target, they are gone and should be removed
+    disconnected: list[str]
+
+
+def client_payload(
+    sync_host: SyncHost, player_name: str, snapshot: StatsSnapshot, compact: bool
+) -> tuple[str | StatsMessage, int] | None:
+    """
+    What to send to the client and its size in bytes, the encoded string in the compact format or the message
+    itself as json. None if the client is up to date or does not want any stats.
+    """
+    message = sync_host.message_for(player_name, snapshot.version, snapshot.player_stats)
+    if message is None:
+        return None
+    if compact:
+        encoded = encode_message(message, snapshot.player_stats, sync_host.history.get(message["base"], {}))
+        return encoded, len(encoded)
+    return message, len(json.dumps(message))
+
+
+def send_to_clients(
+    sync_host: SyncHost,
+    snapshot: StatsSnapshot,
+    own_player_name: str,
+    get_target: Callable[[str], Target | None],
+    send: Callable[[Target, str | StatsMessage, int], None],
+    compact: bool,
+) -> SendResult:
+    """Sends the changes since their last acknowledged version to all clients, nothing to the ones up to date"""
+    sent_bytes = 0
+    messages = 0
+    largest_message = 0
+    disconnected: list[str] = []
+    for player_name in snapshot.player_stats:
+        target = get_target(player_name)
+        if target is None:
+            disconnected.append(player_name)
+            continue
+        if player_name == own_player_name:
+            continue
+
+        payload = client_payload(sync_host, player_name, snapshot, compact)
+        if payload is None:
+            continue
+        data, size = payload
+        send(target, data, size)
+        sent_bytes += size
+        messages += 1
+        largest_message = max(largest_message, size)
+    return SendResult(sent_bytes, messages, largest_message, disconnected)
+
+
+def receive_from_host(
+    sync_client: SyncClient,
+    data: str | StatsMessage,
+    subscribed: bool,
+    acknowledge: Callable[[int], None],
+    subscribe: Callable[[bool], None],
+) -> Mapping[str, PlayerStats] | None:
+    """Applies and acknowledges a message of the host, returns the new stats or None if it could not be applied"""
+    message = decode_message(data, sync_client.history.get) if isinstance(data, str) else data
+    player_stats = None if message is None else sync_client.receive(message)
+    if message is None or player_stats is None:
+        # missed a message, the host has to send everything again
+        acknowledge(RESYNC)
+        return None
+    acknowledge(message["version"])
+    # e.g. the meter was hidden before joining, the host assumes it is shown until told otherwise
+    if not subscribed:
+        subscribe(False)
+    return player_stats
@@ -0,0 +1,333 @@
+"""
+Simulates the stat sync between the host and a lobby of clients over a loopback network, runs outside of the game.
+
+    python simulate_sync.py [--clients 3] [--hidden 0] [--latency 80] [--jitter 20] [--loss 0.01] [--seconds 120]
+                            [--json] [--fixed-interval 200] [--upload-budget 32] [--fight 20] [--pause 10] [--seed 0]
+
+The host and clients run the same store, snapshots, sync, scheduler and send and receive steps as the mod, on a
+simulated clock ticking at the frame rate. The players shoot in fights separated by pauses. Stats messages and the
+acknowledgements of the clients go through a loopback that stands in for the networking decorators, delaying every
+message by the latency plus some jitter and dropping the given share of them. Prints the bytes and messages sent per
+second, how far the clients were behind the host and the CPU time per tick of both sides.
+"""
+
+from __future__ import annotations
+import argparse
+import heapq
+import json
+import random
+import time
+from typing import Any, Callable, NamedTuple, cast
+
+from offline import load_pure_modules
+
+columns, dps, scheduler, share, snapshot, store, sync, hits = load_pure_modules(
+    "columns", "dps", "scheduler", "share", "snapshot", "store", "sync", "hits"
+)
+
+CLASSES = ("Soldier", "Siren", "Hunter", "Gunzerker", "Mechromancer", "Psycho")
+# defaults of the mod options
+DPS_UPDATE_INTERVAL = 0.5
+
+
+# region Fake game objects
+
+
+class PlayerReplicationInfo:
+    """Stands in for the PRI, the host only needs the name and compares them by identity"""
+
+    def __init__(self, player_name: str) -> None:
+        self.PlayerName = player_name
+
+
+class GameReplicationInfo:
+    def __init__(self, pris: list[PlayerReplicationInfo]) -> None:
+        self.PRIArray = pris
+
+
+# endregion
+# region Network
+
+
+class Packet(NamedTuple):
+    arrival: float
+    # breaks ties between packets arriving at the same time, keeps them in sending order
+    sequence: int
+    receiver: Callable[[Any], None]
+    payload: Any
+
+
+class LoopbackNetwork:
+    """
+    Stands in for `networking.targeted` (host to one client) and `networking.host` (client to host).
+
+    Every message arrives after the latency plus a uniformly distributed jitter, or gets lost. Like the real
+    remote calls messages can overtake each other when the jitter is bigger than the time between them.
+    """
+
+    def __init__(self, latency: float, jitter: float, loss: float, rng: random.Random) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = rng
+        self.in_flight: list[Packet] = []
+        self.sequence = 0
+        self.sent_bytes = 0
+        self.sent_messages = 0
+        self.lost_messages = 0
+
+    def send(self, now: float, receiver: Callable[[Any], None], payload: Any, size: int) -> None:
+        self.sent_bytes += size
+        self.sent_messages += 1
+        if self.rng.random() < self.loss:
+            self.lost_messages += 1
+            return
+        arrival = now + max(self.latency + self.rng.uniform(-self.jitter, self.jitter), 0)
+        self.sequence += 1
+        heapq.heappush(self.in_flight, Packet(arrival, self.sequence, receiver, payload))
+
+    def deliver(self, now: float) -> None:
+        while self.in_flight and self.in_flight[0].arrival <= now:
+            packet = heapq.heappop(self.in_flight)
+            packet.receiver(packet.payload)
+
+
+# endregion
+# region Host and clients
+
+
+class SimulatedHost:
+    """The host side of the mod: drains hits every tick, updates the dps and sends the stats to the clients"""
+
+    def __init__(self, args: argparse.Namespace, gri: GameReplicationInfo, rng: random.Random) -> None:
+        self.args = args
+        self.gri = gri
+        self.rng = rng
+        # the first PRI is the host itself, everyone is already spawned
+        self.own_player_name = gri.PRIArray[0].PlayerName
+        self.player_pris = {pri.PlayerName: pri for pri in gri.PRIArray}
+        self.network: LoopbackNetwork | None = None
+        self.clients: dict[str, SimulatedClient] = {}
+        self.now = 0.0
+        self.store = store.StatsStore()
+        self.hits = hits.HitBuffer()
+        self.snapshot = snapshot.EMPTY_SNAPSHOT
+        self.sync_host = sync.SyncHost()
+        self.scheduler = scheduler.SyncScheduler(args.upload_budget * 1000)
+        self.next_dps_update = 0.0
+        self.last_damage_epoch = 0.0
+        self.next_fixed_sync = 0.0
+        # when each version got published, to measure how long clients were behind
+        self.published: dict[int, float] = {0: 0.0}
+        for pri in gri.PRIArray:
+            self.store.add_player(
+                pri.PlayerName,
+                CLASSES[len(self.store) % len(CLASSES)],
+                0.0,
+                dps.RollingDps(tuple(columns.DPS_WINDOWS.values()), 0.0),
+                len(columns.HIT_QUANTILES),
+            )
+
+    def is_fighting(self, now: float) -> bool:
+        cycle = self.args.fight + self.args.pause
+        return cycle <= 0 or now % cycle < self.args.fight
+
+    def shoot(self, now: float, tick: float) -> None:
+        if not self.is_fighting(now):
+            return
+        for record in self.store:
+            # roughly poisson distributed hits, a few big ones among lots of small ones
+            for _ in range(int(self.rng.expovariate(1 / (self.args.hits_per_second * tick)) + 0.5)):
+                damage = self.rng.lognormvariate(11, 1.5)
+                shield = damage * self.rng.random() if self.rng.random() < 0.2 else 0
+                if self.hits.append(record.slot, damage - shield, shield, 0, 10**9, None, None):
+                    self.drain(now)
+
+    def drain(self, now: float) -> None:
+        if self.hits.size > 0:
+            self.last_damage_epoch = now
+        self.store.add_hits(self.hits, now, True, str)
+        self.hits.clear()
+
+    def publish(self, now: float) -> None:
+        self.snapshot = self.snapshot.publish(self.store.player_stats(True))
+        self.published.setdefault(self.snapshot.version, now)
+
+    def update_dps(self, now: float) -> None:
+        if now < self.next_dps_update:
+            return
+        self.next_dps_update = now + DPS_UPDATE_INTERVAL
+        self.store.update_rates(self.last_damage_epoch, True, columns.HIT_QUANTILES.values())
+
+    def is_sync_due(self, now: float) -> bool:
+        if self.args.fixed_interval is None:
+            return self.scheduler.is_due(now, self.snapshot.version)
+        if now < self.next_fixed_sync:
+            return False
+        self.next_fixed_sync = now + self.args.fixed_interval / 1000
+        return True
+
+    def send_stats(self) -> None:
+        # the same send step as the mod, only the network and PRIs are fake
+        version = self.snapshot.version
+        result = share.send_to_clients(
+            self.sync_host, self.snapshot, self.own_player_name, self.player_pris.get, self.send, not self.args.json
+        )
+        self.scheduler.update(
+            self.now, version, result.sent_bytes, result.messages, result.largest_message, len(self.clients)
+        )
+
+    def send(self, pri: PlayerReplicationInfo, data: str | dict, size: int) -> None:
+        cast(LoopbackNetwork, self.network).send(self.now, self.clients[pri.PlayerName].receive, data, size)
+
+    def acknowledge(self, payload: tuple[str, int]) -> None:
+        self.sync_host.acknowledge(*payload)
+
+    def subscribe(self, payload: tuple[str, bool]) -> None:
+        player_name, subscribed = payload
+        if player_name in self.player_pris:
+            self.sync_host.subscribe(player_name, subscribed)
+
+    def tick(self, now: float, tick: float) -> None:
+        self.now = now
+        self.shoot(now, tick)
+        self.drain(now)
+        self.update_dps(now)
+        self.publish(now)
+        if self.is_sync_due(now):
+            self.send_stats()
+
+
+class SimulatedClient:
+    """The client side of the mod: applies the stats messages with the same receive step and answers the host"""
+
+    def __init__(self, player_name: str, network: LoopbackNetwork, host: SimulatedHost, hidden: bool) -> None:
+        self.player_name = player_name
+        self.network = network
+        self.host = host
+        # whether the meter is hidden, the host only finds out with the first message
+        self.hidden = hidden
+        self.sync_client = sync.SyncClient()
+        self.version = 0
+        self.now = 0.0
+        self.resyncs = 0
+
+    def receive(self, data: str | dict) -> None:
+        player_stats = share.receive_from_host(
+            self.sync_client, data, not self.hidden, self.acknowledge, self.subscribe
+        )
+        if player_stats is None:
+            self.resyncs += 1
+            return
+        # messages can overtake each other, the newest version received is what the client shows
+        self.version = max(self.sync_client.history)
+
+    def acknowledge(self, version: int) -> None:
+        payload = (self.player_name, version)
+        self.network.send(self.now, self.host.acknowledge, payload, len(json.dumps(payload)))
+
+    def subscribe(self, subscribed: bool) -> None:
+        payload = (self.player_name, subscribed)
+        self.network.send(self.now, self.host.subscribe, payload, len(json.dumps(payload)))
+
+
+# endregion
+# region Report
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def simulate(args: argparse.Namespace) -> dict[str, float]:
+    rng = random.Random(args.seed)
+    pris = [PlayerReplicationInfo(f"Player {number}") for number in range(args.clients + 1)]
+    gri = GameReplicationInfo(pris)
+    host = SimulatedHost(args, gri, rng)
+    to_clients = LoopbackNetwork(args.latency / 1000, args.jitter / 1000, args.loss, rng)
+    to_host = LoopbackNetwork(args.latency / 1000, args.jitter / 1000, args.loss, rng)
+    # the first PRI is the host itself, the last ones hide their meter
+    clients = {
+        pri.PlayerName: SimulatedClient(pri.PlayerName, to_host, host, number > args.clients - args.hidden)
+        for number, pri in enumerate(pris[1:], start=1)
+    }
+    host.network = to_clients
+    host.clients = clients
+
+    tick = 1 / args.tick_rate
+    host_times: list[float] = []
+    client_times: list[float] = []
+    staleness: list[float] = []
+    # messages sent while nobody is fighting, those should only be the last changes of a fight
+    idle_messages = 0
+    idle_ticks = 0
+    for i in range(int(args.seconds * args.tick_rate)):
+        now = i * tick
+
+        start = time.perf_counter_ns()
+        sent_messages = to_clients.sent_messages
+        to_host.deliver(now)
+        host.tick(now, tick)
+        host_times.append((time.perf_counter_ns() - start) / 1000)
+        if not host.is_fighting(now):
+            idle_messages += to_clients.sent_messages - sent_messages
+            idle_ticks += 1
+
+        start = time.perf_counter_ns()
+        for client in clients.values():
+            client.now = now
+        to_clients.deliver(now)
+        client_times.append((time.perf_counter_ns() - start) / 1000 / max(len(clients), 1))
+
+        # how long ago the host published the first version the client does not have yet
+        for client in clients.values():
+            if client.hidden:
+                continue
+            missing = host.published.get(client.version + 1)
+            staleness.append(0.0 if missing is None else (now - missing) * 1000)
+
+    return {
+        "host bytes/s": to_clients.sent_bytes / args.seconds,
+        "host messages/s": to_clients.sent_messages / args.seconds,
+        "idle messages/s": idle_messages / max(idle_ticks * tick, tick),
+        "client bytes/s": to_host.sent_bytes / args.seconds / max(len(clients), 1),
+        "lost messages": to_clients.lost_messages + to_host.lost_messages,
+        "resyncs": sum(client.resyncs for client in clients.values()),
+        "staleness mean ms": sum(staleness) / max(len(staleness), 1),
+        "staleness p95 ms": percentile(staleness, 0.95),
+        "staleness max ms": max(staleness, default=0.0),
+        "host tick mean µs": sum(host_times) / len(host_times),
+        "host tick p99 µs": percentile(host_times, 0.99),
+        "client tick mean µs": sum(client_times) / len(client_times),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=3)
+    parser.add_argument("--hidden", type=int, default=0, help="number of clients that hide their meter")
+    parser.add_argument("--latency", type=float, default=80, help="one way latency in ms")
+    parser.add_argument("--jitter", type=float, default=20, help="maximum deviation from the latency in ms")
+    parser.add_argument("--loss", type=float, default=0.0, help="share of messages that get lost")
+    parser.add_argument("--seconds", type=float, default=120)
+    parser.add_argument("--tick-rate", type=float, default=60)
+    parser.add_argument("--hits-per-second", type=float, default=8, help="per player while fighting")
+    parser.add_argument("--fight", type=float, default=20, help="seconds of fighting before each pause")
+    parser.add_argument("--pause", type=float, default=10, help="seconds without any hits between fights")
+    parser.add_argument("--json", action="store_true", help="send json instead of the compact format")
+    parser.add_argument(
+        "--fixed-interval", type=float, default=None, help="sync every this many ms instead of adaptively"
+    )
+    parser.add_argument("--upload-budget", type=float, default=32, help="host upload budget in KB/s")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for label, value in simulate(args).items():
+        print(f"{label:20} {value:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
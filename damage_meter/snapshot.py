@@ -0,0 +1,58 @@
+from __future__ import annotations
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, TypedDict
+
+
+class PlayerStats(TypedDict):
+    number: int
+    character_class: str
+    damage: int
+    flesh_damage: int
+    shield_damage: int
+    overkill_damage: int
+    damage_taken: int
+    hits: int
+    dps: float
+    # rolling dps, in the order of DPS_WINDOWS
+    window_dps: list[float]
+    biggest_hit: float
+    # hit sizes, in the order of HIT_QUANTILES
+    hit_quantiles: list[float]
+    start_epoch: float
+
+
+class StatsSnapshot(NamedTuple):
+    """
+    Immutable, versioned view of the stats of all players.
+
+    Readers keep a reference to a snapshot and always see a consistent state, no matter what the writers do.
+    The stats inside a published snapshot must never be mutated, nested values have to be replaced instead.
+    """
+
+    version: int
+    player_stats: Mapping[str, PlayerStats]
+
+    def publish(self, player_stats: Mapping[str, PlayerStats]) -> StatsSnapshot:
+        """
+        Creates the next snapshot from the current stats of the writer.
+
+        Stats of players that did not change are shared with this snapshot instead of copied.
+        If nothing changed at all this snapshot is returned, so the version only increases on actual changes.
+        """
+        previous = self.player_stats
+        changed = len(previous) != len(player_stats)
+        shared: dict[str, PlayerStats] = {}
+        for player_name, stats in player_stats.items():
+            previous_stats = previous.get(player_name)
+            if previous_stats is not None and previous_stats == stats:
+                shared[player_name] = previous_stats
+            else:
+                shared[player_name] = stats.copy()
+                changed = True
+
+        if not changed:
+            return self
+        return StatsSnapshot(self.version + 1, MappingProxyType(shared))
+
+
+EMPTY_SNAPSHOT = StatsSnapshot(0, MappingProxyType({}))
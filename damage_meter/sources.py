@@ -0,0 +1,57 @@
+from __future__ import annotations
+from array import array
+from typing import NamedTuple
+
+# counters per player, the top sources are exact as long as there are fewer distinct sources than this
+DEFAULT_COUNTERS = 16
+
+
+class SourceEstimate(NamedTuple):
+    name: str
+    damage: float
+    # the real damage is between damage - error and damage
+    error: float
+
+
+class HeavyHitters:
+    """
+    Weighted space saving sketch of the damage per source.
+
+    Only a fixed number of sources is counted. A new source replaces the one with the lowest damage and
+    inherits its damage as error, so the sources with the most damage are always kept with a known error bound.
+    """
+
+    __slots__ = ("names", "damage", "errors", "index", "total")
+
+    def __init__(self, counters: int = DEFAULT_COUNTERS) -> None:
+        self.names: list[str] = [""] * counters
+        self.damage = array("d", [0]) * counters
+        self.errors = array("d", [0]) * counters
+        # source name -> counter
+        self.index: dict[str, int] = {}
+        self.total = 0.0
+
+    def add(self, name: str, damage: float) -> None:
+        self.total += damage
+        i = self.index.get(name)
+        if i is not None:
+            self.damage[i] += damage
+            return
+
+        if len(self.index) < len(self.names):
+            i = len(self.index)
+            error = 0.0
+        else:
+            # the sketch is small, a linear scan is cheaper than keeping a heap up to date
+            i = min(range(len(self.damage)), key=self.damage.__getitem__)
+            error = self.damage[i]
+            del self.index[self.names[i]]
+
+        self.names[i] = name
+        self.damage[i] = error + damage
+        self.errors[i] = error
+        self.index[name] = i
+
+    def top(self, n: int) -> list[SourceEstimate]:
+        counters = sorted(self.index.values(), key=self.damage.__getitem__, reverse=True)[:n]
+        return [SourceEstimate(self.names[i], self.damage[i], self.errors[i]) for i in counters]
@@ -0,0 +1,134 @@
+from __future__ import annotations
+from array import array
+from typing import Sequence
+
+SAMPLE_INTERVAL = 1.0
+# once full, neighbouring samples get merged and the interval doubles, so memory stays fixed
+MAX_SAMPLES = 1024
+
+
+def largest_triangle_three_buckets(values: Sequence[float], threshold: int) -> list[tuple[int, float]]:
+    """
+    Downsamples evenly spaced values to at most threshold points, keeping the overall shape including spikes.
+
+    The first and last value are always kept, every bucket in between keeps the point forming the largest
+    triangle with the point kept in the previous bucket and the average of the next bucket.
+    """
+    size = len(values)
+    if threshold >= size or threshold < 3:
+        return list(enumerate(values))
+
+    points = [(0, values[0])]
+    bucket_size = (size - 2) / (threshold - 2)
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        next_start = end
+        next_end = min(int((bucket + 2) * bucket_size) + 1, size)
+        average_x = (next_start + next_end - 1) / 2
+        average_y = sum(values[next_start:next_end]) / (next_end - next_start)
+
+        previous_y = values[previous]
+        best_area = -1.0
+        best = start
+        for i in range(start, end):
+            # twice the area, only used for comparisons
+            area = abs((previous - average_x) * (values[i] - previous_y) - (previous - i) * (average_y - previous_y))
+            if area > best_area:
+                best_area = area
+                best = i
+        points.append((best, values[best]))
+        previous = best
+
+    points.append((size - 1, values[size - 1]))
+    return points
+
+
+class DpsSeries:
+    """
+    DPS of a player over the current encounter, at a fixed resolution.
+
+    Built from the total damage whenever new stats arrive, which works the same way on the host and on clients.
+    The downsampled points are cached until the next sample gets added.
+    """
+
+    __slots__ = (
+        "samples",
+        "interval",
+        "slot_end_epoch",
+        "last_epoch",
+        "last_damage",
+        "slot_damage",
+        "version",
+        "_points",
+        "_points_key",
+    )
+
+    def __init__(self) -> None:
+        self.samples = array("d")
+        self.interval = SAMPLE_INTERVAL
+        self.slot_end_epoch: float | None = None
+        self.last_epoch = 0.0
+        self.last_damage = 0
+        self.slot_damage = 0.0
+        self.version = 0
+        self._points: list[tuple[float, float]] = []
+        self._points_key: tuple[int, int] | None = None
+
+    def clear(self) -> None:
+        self.samples = array("d")
+        self.interval = SAMPLE_INTERVAL
+        self.slot_end_epoch = None
+        self.slot_damage = 0.0
+        self.version += 1
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) * self.interval
+
+    def add(self, epoch: float, damage: int) -> None:
+        """Adds the total damage at the given time"""
+        # less damage than before means the stats got reset, i.e. a new encounter started,
+        # an earlier time means the world time started over after a map load
+        if self.slot_end_epoch is None or damage < self.last_damage or epoch < self.last_epoch:
+            self.clear()
+            self.slot_end_epoch = epoch + self.interval
+            self.last_epoch = epoch
+            self.last_damage = damage
+            return
+
+        # spread the new damage evenly over the time since the last update
+        elapsed = epoch - self.last_epoch
+        rate = (damage - self.last_damage) / elapsed if elapsed > 0 else 0
+        if elapsed <= 0:
+            self.slot_damage += damage - self.last_damage
+        start = self.last_epoch
+        while epoch >= self.slot_end_epoch:
+            self.slot_damage += rate * (self.slot_end_epoch - start)
+            self._append(self.slot_damage / self.interval)
+            self.slot_damage = 0
+            start = self.slot_end_epoch
+            self.slot_end_epoch += self.interval
+        self.slot_damage += rate * (epoch - start)
+
+        self.last_epoch = epoch
+        self.last_damage = damage
+
+    def points(self, threshold: int) -> list[tuple[float, float]]:
+        """At most threshold points of (seconds since the start, dps)"""
+        key = (self.version, threshold)
+        if key != self._points_key:
+            self._points_key = key
+            self._points = [
+                (index * self.interval, dps) for index, dps in largest_triangle_three_buckets(self.samples, threshold)
+            ]
+        return self._points
+
+    def _append(self, dps: float) -> None:
+        if len(self.samples) >= MAX_SAMPLES:
+            self.samples = array("d", [(a + b) / 2 for a, b in zip(self.samples[::2], self.samples[1::2])])
+            self.interval *= 2
+        self.samples.append(dps)
+        self.version += 1
@@ -0,0 +1,255 @@
+from __future__ import annotations
+from array import array
+from typing import Callable, Hashable, Iterable, Iterator
+from .columns import average_dps, damage_dealt
+from .dps import RollingDps
+from .quantiles import HitSizeSketch
+from .hits import HitBuffer
+from .snapshot import PlayerStats
+from .sources import HeavyHitters
+
+INITIAL_CAPACITY = 8
+
+
+class PlayerRecord:
+    """Everything about a player that is not a per hit metric"""
+
+    __slots__ = (
+        "name",
+        "slot",
+        "character_class",
+        "start_epoch",
+        "dps",
+        "window_dps",
+        "rolling_dps",
+        "sources",
+        "hit_sizes",
+        "hit_quantiles",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        slot: int,
+        character_class: str,
+        start_epoch: float,
+        rolling_dps: RollingDps,
+        quantiles: int,
+    ) -> None:
+        self.name = name
+        self.slot = slot
+        self.character_class = character_class
+        self.start_epoch = start_epoch
+        self.dps: float = 0
+        self.window_dps: list[float] = [0] * len(rolling_dps.windows)
+        self.rolling_dps = rolling_dps
+        self.sources = HeavyHitters()
+        self.hit_sizes = HitSizeSketch()
+        # only updated together with the dps, walking the sketch on every hit would be too slow
+        self.hit_quantiles: list[float] = [0] * quantiles
+
+
+class StatsStore:
+    """
+    Stats of all players on the host.
+
+    Per hit metrics are stored in parallel columns indexed by the player slot, so a new metric only costs
+    one array and one addition per hit. The PlayerStats shown and shared with clients are only rebuilt
+    for players whose values changed since the last call of `player_stats`.
+    """
+
+    METRICS = ("flesh", "shield", "overkill", "taken", "hits")
+
+    __slots__ = ("records", "slots", *METRICS, "_dirty", "_player_stats", "_include_overkill")
+
+    def __init__(self) -> None:
+        self.records: dict[int, PlayerRecord] = {}
+        # player name -> slot, used by the damage hook
+        self.slots: dict[str, int] = {}
+
+        self.flesh = array("d", [0]) * INITIAL_CAPACITY
+        self.shield = array("d", [0]) * INITIAL_CAPACITY
+        # part of flesh + shield that exceeded the health of the enemy
+        self.overkill = array("d", [0]) * INITIAL_CAPACITY
+        self.taken = array("d", [0]) * INITIAL_CAPACITY
+        self.hits = array("q", [0]) * INITIAL_CAPACITY
+
+        self._dirty: set[int] = set()
+        self._player_stats: dict[int, PlayerStats] = {}
+        self._include_overkill = True
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[PlayerRecord]:
+        return iter(self.records.values())
+
+    def get(self, player_name: str) -> PlayerRecord | None:
+        slot = self.slots.get(player_name)
+        return None if slot is None else self.records[slot]
+
+    def mark_dirty(self, record: PlayerRecord) -> None:
+        self._dirty.add(record.slot)
+
+    def add_player(
+        self,
+        player_name: str,
+        character_class: str,
+        epoch: float,
+        rolling_dps: RollingDps,
+        quantiles: int,
+    ) -> PlayerRecord:
+        """Adds the player with all metrics at zero, a player that already exists keeps their slot"""
+        slot = self.slots.get(player_name)
+        if slot is None:
+            # reuse the lowest free slot, the slot is also the number used for the player color
+            slot = next(num for num in range(len(self.records) + 1) if num not in self.records)
+            self._ensure_capacity(slot + 1)
+
+        record = PlayerRecord(player_name, slot, character_class, epoch, rolling_dps, quantiles)
+        self.records[slot] = record
+        self.slots[player_name] = slot
+        self._reset_slot(slot)
+        return record
+
+    def remove_player(self, player_name: str) -> None:
+        slot = self.slots.pop(player_name, None)
+        if slot is None:
+            return
+        del self.records[slot]
+        self._player_stats.pop(slot, None)
+        self._dirty.discard(slot)
+
+    def reset(self) -> None:
+        for slot in self.records:
+            self._reset_slot(slot)
+            self.records[slot].dps = 0
+            self.records[slot].window_dps = [0] * len(self.records[slot].window_dps)
+            self.records[slot].sources = HeavyHitters()
+            self.records[slot].hit_sizes = HitSizeSketch()
+            self.records[slot].hit_quantiles = [0] * len(self.records[slot].hit_quantiles)
+
+    def add_hits(
+        self,
+        hits: HitBuffer,
+        epoch: float,
+        include_overkill: bool,
+        get_source_name: Callable[[Hashable], str],
+    ) -> None:
+        """Adds all hits of the buffer to the columns, rolling dps and sources of the players, without clearing it"""
+        records = self.records
+        flesh_column, shield_column, overkill_column, hits_column = self.flesh, self.shield, self.overkill, self.hits
+        # all hits of a drain share the same time, so the rolling dps only needs one update per player
+        damage_by_slot: dict[int, float] = {}
+        # same for the sources, usually a player only uses one or two per tick
+        damage_by_source: dict[tuple[int, Hashable], float] = {}
+        for i in range(hits.size):
+            slot = hits.slots[i]
+            # player disconnected since the hit
+            if slot not in records:
+                continue
+            flesh = hits.flesh[i]
+            shield = hits.shield[i]
+            overkill = hits.overkill[i]
+            flesh_column[slot] += flesh
+            shield_column[slot] += shield
+            overkill_column[slot] += overkill
+            hits_column[slot] += 1
+
+            damage = flesh + shield if include_overkill else flesh + shield - overkill
+            damage_by_slot[slot] = damage_by_slot.get(slot, 0) + damage
+            records[slot].hit_sizes.add(damage)
+            source_key = (slot, hits.sources[i])
+            damage_by_source[source_key] = damage_by_source.get(source_key, 0) + damage
+
+        for slot, damage in damage_by_slot.items():
+            records[slot].rolling_dps.add(epoch, damage)
+        for (slot, source), damage in damage_by_source.items():
+            records[slot].sources.add(get_source_name(source), damage)
+        self._dirty.update(damage_by_slot)
+
+    def restore_player(self, record: PlayerRecord, stats: PlayerStats) -> None:
+        """Sets the metrics of the player to previously persisted stats, the hit sizes and sources start over"""
+        slot = record.slot
+        self.flesh[slot] = stats["flesh_damage"]
+        self.shield[slot] = stats["shield_damage"]
+        self.overkill[slot] = stats["overkill_damage"]
+        self.taken[slot] = stats["damage_taken"]
+        self.hits[slot] = stats["hits"]
+        record.dps = stats["dps"]
+        record.window_dps = list(stats["window_dps"])
+        record.hit_quantiles = list(stats["hit_quantiles"])
+        record.hit_sizes.max = stats["biggest_hit"]
+        self._dirty.add(slot)
+
+    def update_rates(self, epoch: float, include_overkill: bool, quantiles: Iterable[float]) -> None:
+        """
+        Recalculates dps, rolling dps and hit quantiles of all players as of the given time, usually the last damage.
+        Only players whose values changed get rebuilt, so without new damage nothing changes.
+        """
+        quantiles = tuple(quantiles)
+        for record in self.records.values():
+            # players that joined after the given time have not dealt any damage yet
+            duration = max(epoch - record.start_epoch, 0)
+            dps = max(average_dps(self.damage(record.slot, include_overkill), duration), 0)
+            window_dps = [record.rolling_dps.dps(i, epoch) for i in range(len(record.window_dps))]
+            hit_quantiles = [record.hit_sizes.quantile(q) for q in quantiles]
+            if dps == record.dps and window_dps == record.window_dps and hit_quantiles == record.hit_quantiles:
+                continue
+            record.dps = dps
+            record.window_dps = window_dps
+            record.hit_quantiles = hit_quantiles
+            self._dirty.add(record.slot)
+
+    def add_damage_taken(self, hits: HitBuffer) -> None:
+        """Adds all hits players took to the damage taken column, without clearing the buffer"""
+        taken_column = self.taken
+        for i in range(hits.size):
+            slot = hits.slots[i]
+            if slot not in self.records:
+                continue
+            taken_column[slot] += hits.flesh[i] + hits.shield[i]
+            self._dirty.add(slot)
+
+    def damage(self, slot: int, include_overkill: bool) -> int:
+        return int(damage_dealt(self.flesh[slot], self.shield[slot], self.overkill[slot], include_overkill))
+
+    def player_stats(self, include_overkill: bool) -> dict[str, PlayerStats]:
+        """The current stats of all players, only rebuilding the ones that changed"""
+        if include_overkill != self._include_overkill:
+            self._include_overkill = include_overkill
+            self._dirty.update(self.records)
+
+        for slot in self._dirty:
+            record = self.records[slot]
+            self._player_stats[slot] = {
+                "number": slot,
+                "character_class": record.character_class,
+                "damage": self.damage(slot, include_overkill),
+                "flesh_damage": int(self.flesh[slot]),
+                "shield_damage": int(self.shield[slot]),
+                "overkill_damage": int(self.overkill[slot]),
+                "damage_taken": int(self.taken[slot]),
+                "hits": self.hits[slot],
+                "dps": record.dps,
+                "window_dps": record.window_dps,
+                "biggest_hit": record.hit_sizes.max,
+                "hit_quantiles": record.hit_quantiles,
+                "start_epoch": record.start_epoch,
+            }
+        self._dirty.clear()
+        return {self.records[slot].name: stats for slot, stats in self._player_stats.items()}
+
+    def _ensure_capacity(self, size: int) -> None:
+        capacity = len(self.flesh)
+        if size <= capacity:
+            return
+        grow = max(size, capacity * 2) - capacity
+        for metric in self.METRICS:
+            column: array = getattr(self, metric)
+            column.extend(array(column.typecode, [0]) * grow)
+
+    def _reset_slot(self, slot: int) -> None:
+        for metric in self.METRICS:
+            getattr(self, metric)[slot] = 0
+        self._dirty.add(slot)
@@ -0,0 +1,145 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Any, Mapping, TypedDict
+from .snapshot import PlayerStats
+
+# sent versions the host keeps to build deltas from, clients that acknowledged an older one get everything again
+HOST_HISTORY_SIZE = 32
+# received versions a client keeps, deltas are always based on one of the last few
+CLIENT_HISTORY_SIZE = 8
+# acknowledged by a client that could not apply a delta, makes the host send everything again
+RESYNC = -1
+
+
+class StatsMessage(TypedDict):
+    # host side snapshot version of the stats in this message
+    version: int
+    # version the changes are based on, RESYNC if the message contains all stats
+    base: int
+    # changed fields per player, players that are new since the base version have all fields
+    changed: dict[str, dict[str, Any]]
+    # players that are gone since the base version
+    removed: list[str]
+
+
+def diff_stats(base: Mapping[str, PlayerStats], current: Mapping[str, PlayerStats]) -> StatsMessage:
+    """Changes from base to current, the version fields still have to be filled in"""
+    changed: dict[str, dict[str, Any]] = {}
+    for player_name, stats in current.items():
+        base_stats = base.get(player_name)
+        # published snapshots share the stats of players that did not change
+        if base_stats is stats:
+            continue
+        if base_stats is None:
+            changed[player_name] = dict(stats)
+            continue
+        fields = {field: value for field, value in stats.items() if base_stats.get(field) != value}
+        if fields:
+            changed[player_name] = fields
+    removed = [player_name for player_name in base if player_name not in current]
+    return StatsMessage(version=0, base=RESYNC, changed=changed, removed=removed)
+
+
+class ClientSyncState:
+    __slots__ = ("acknowledged_version", "sent_version", "subscribed")
+
+    def __init__(self) -> None:
+        # clients only want stats while they show the meter, until they said otherwise assume they do
+        self.subscribed = True
+        # last version the client confirmed to have, deltas are based on this
+        self.acknowledged_version = RESYNC
+        # last version sent to the client, nothing gets sent until there is a newer one
+        self.sent_version = RESYNC
+
+
+class SyncHost:
+    """
+    Host side of the stat sync.
+
+    Every client gets the changes since the last version it acknowledged, or all stats after joining or once it
+    lost track. Nothing gets sent while the stats do not change or to clients that hide the meter.
+    """
+
+    __slots__ = ("clients", "history")
+
+    def __init__(self) -> None:
+        self.clients: dict[str, ClientSyncState] = {}
+        self.history: OrderedDict[int, Mapping[str, PlayerStats]] = OrderedDict()
+
+    def remove_client(self, player_name: str) -> None:
+        self.clients.pop(player_name, None)
+
+    def subscribe(self, player_name: str, subscribed: bool) -> None:
+        client = self.clients.get(player_name)
+        if client is None:
+            client = self.clients[player_name] = ClientSyncState()
+        client.subscribed = subscribed
+
+    def message_for(
+        self, player_name: str, version: int, player_stats: Mapping[str, PlayerStats]
+    ) -> StatsMessage | None:
+        """The message to send to the client, None if the client is already up to date or not subscribed"""
+        client = self.clients.get(player_name)
+        if client is None:
+            client = self.clients[player_name] = ClientSyncState()
+        if not client.subscribed or client.sent_version == version:
+            return None
+
+        if version not in self.history:
+            self.history[version] = player_stats
+            if len(self.history) > HOST_HISTORY_SIZE:
+                self.history.popitem(last=False)
+
+        base = self.history.get(client.acknowledged_version)
+        if base is None:
+            message = StatsMessage(version=version, base=RESYNC, changed=dict(player_stats), removed=[])
+        else:
+            message = diff_stats(base, player_stats)
+            message["version"] = version
+            message["base"] = client.acknowledged_version
+        client.sent_version = version
+        return message
+
+    def acknowledge(self, player_name: str, version: int) -> None:
+        client = self.clients.get(player_name)
+        if client is None:
+            return
+        if version == RESYNC:
+            # the client lost track, send everything with the next message
+            client.acknowledged_version = RESYNC
+            client.sent_version = RESYNC
+        elif version > client.acknowledged_version:
+            client.acknowledged_version = version
+
+
+class SyncClient:
+    """Client side of the stat sync, applies the messages of the host on top of the version they are based on"""
+
+    __slots__ = ("history",)
+
+    def __init__(self) -> None:
+        self.history: OrderedDict[int, Mapping[str, PlayerStats]] = OrderedDict()
+
+    def receive(self, message: StatsMessage) -> Mapping[str, PlayerStats] | None:
+        """The stats after applying the message, None if its base is unknown and everything has to be sent again"""
+        if message["base"] == RESYNC:
+            # a full message means the host lost track of this client, e.g. after a reload, so versions restart
+            self.history.clear()
+            base: Mapping[str, PlayerStats] = {}
+        else:
+            found = self.history.get(message["base"])
+            if found is None:
+                return None
+            base = found
+
+        player_stats = dict(base)
+        for player_name, fields in message["changed"].items():
+            stats = player_stats.get(player_name)
+            player_stats[player_name] = fields if stats is None else {**stats, **fields}  # type: ignore
+        for player_name in message["removed"]:
+            player_stats.pop(player_name, None)
+
+        self.history[message["version"]] = player_stats
+        if len(self.history) > CLIENT_HISTORY_SIZE:
+            self.history.popitem(last=False)
+        return player_stats
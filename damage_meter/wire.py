@@ -0,0 +1,154 @@
+from __future__ import annotations
+import struct
+import zlib
+from base64 import b85decode, b85encode
+from typing import Any, Callable, Mapping
+from .columns import DPS_WINDOWS, HIT_QUANTILES
+from .snapshot import PlayerStats
+from .sync import StatsMessage
+
+# compact binary alternative to sending the stats messages as json
+#
+# header: flags, version, base, number of changed players, number of removed players
+# removed players: their slot in the base version
+# changed players: slot, bitmask of the changed fields, then the values of those fields in the order of FIELDS
+# strings (player names, classes) are only sent when they are new: the player name together with the slot
+# (so on join or after a resync), the class when it changes. All other players are referred to by their slot.
+# the whole thing is zlib compressed if that is smaller and then base85 encoded, the transport is a string
+
+HEADER = struct.Struct("<BiiBB")
+PLAYER = struct.Struct("<BH")
+STRING_LENGTH = struct.Struct("<B")
+REMOVED = struct.Struct("<B")
+
+FLAG_COMPRESSED = 1
+# small messages do not get smaller by compressing them
+COMPRESS_MIN_SIZE = 96
+
+STRING = ""
+FIELDS: tuple[tuple[str, str], ...] = (
+    ("number", "B"),
+    ("character_class", STRING),
+    ("damage", "q"),
+    ("flesh_damage", "q"),
+    ("shield_damage", "q"),
+    ("overkill_damage", "q"),
+    ("damage_taken", "q"),
+    ("hits", "I"),
+    # floats are only displayed, so single precision is enough
+    ("dps", "f"),
+    ("window_dps", f"{len(DPS_WINDOWS)}f"),
+    ("biggest_hit", "f"),
+    ("hit_quantiles", f"{len(HIT_QUANTILES)}f"),
+    ("start_epoch", "d"),
+)
+FIELD_BITS = {field: 1 << i for i, (field, _) in enumerate(FIELDS)}
+FIELD_STRUCTS = {field: struct.Struct("<" + fmt) if fmt != STRING else None for field, fmt in FIELDS}
+
+
+def write_string(parts: list[bytes], value: str) -> None:
+    encoded = value.encode("utf-8")[:255]
+    parts.append(STRING_LENGTH.pack(len(encoded)))
+    parts.append(encoded)
+
+
+def read_string(data: bytes, offset: int) -> tuple[str, int]:
+    (length,) = STRING_LENGTH.unpack_from(data, offset)
+    offset += STRING_LENGTH.size
+    return data[offset : offset + length].decode("utf-8", "replace"), offset + length
+
+
+def encode_message(
+    message: StatsMessage, player_stats: Mapping[str, PlayerStats], base_stats: Mapping[str, PlayerStats]
+) -> str:
+    """Encodes the message built from the given stats and the stats of its base version"""
+    parts: list[bytes] = []
+    for player_name in message["removed"]:
+        parts.append(REMOVED.pack(base_stats[player_name]["number"]))
+
+    for player_name, fields in message["changed"].items():
+        mask = 0
+        for field in fields:
+            mask |= FIELD_BITS[field]
+        parts.append(PLAYER.pack(player_stats[player_name]["number"], mask))
+        if "number" in fields:
+            write_string(parts, player_name)
+        for field, fmt in FIELDS:
+            if field not in fields:
+                continue
+            value = fields[field]
+            field_struct = FIELD_STRUCTS[field]
+            if field_struct is None:
+                write_string(parts, value)
+            elif isinstance(value, list):
+                parts.append(field_struct.pack(*value))
+            else:
+                parts.append(field_struct.pack(value if fmt in ("f", "d") else int(value)))
+
+    body = b"".join(parts)
+    flags = 0
+    if len(body) >= COMPRESS_MIN_SIZE:
+        compressed = zlib.compress(body)
+        if len(compressed) < len(body):
+            body = compressed
+            flags |= FLAG_COMPRESSED
+    header = HEADER.pack(flags, message["version"], message["base"], len(message["changed"]), len(message["removed"]))
+    return b85encode(header + body).decode("ascii")
+
+
+def decode_message(encoded: str, get_base: Callable[[int], Mapping[str, PlayerStats] | None]) -> StatsMessage | None:
+    """
+    Decodes the message, players that are only referred to by their slot are looked up in the base version.
+    None if the base version is unknown, the same as the sync client would return.
+    """
+    data = b85decode(encoded)
+    flags, version, base, changed_count, removed_count = HEADER.unpack_from(data)
+    body = data[HEADER.size :]
+    if flags & FLAG_COMPRESSED:
+        body = zlib.decompress(body)
+
+    names_by_number: dict[int, str] | None = None
+
+    def name_of(number: int) -> str | None:
+        nonlocal names_by_number
+        if names_by_number is None:
+            base_stats = get_base(base) or {}
+            names_by_number = {stats["number"]: player_name for player_name, stats in base_stats.items()}
+        return names_by_number.get(number)
+
+    offset = 0
+    removed: list[str] = []
+    for _ in range(removed_count):
+        (number,) = REMOVED.unpack_from(body, offset)
+        offset += REMOVED.size
+        player_name = name_of(number)
+        if player_name is None:
+            return None
+        removed.append(player_name)
+
+    changed: dict[str, dict[str, Any]] = {}
+    for _ in range(changed_count):
+        number, mask = PLAYER.unpack_from(body, offset)
+        offset += PLAYER.size
+        if mask & FIELD_BITS["number"]:
+            player_name, offset = read_string(body, offset)
+        else:
+            found = name_of(number)
+            if found is None:
+                return None
+            player_name = found
+
+        fields: dict[str, Any] = {}
+        for field, fmt in FIELDS:
+            if not mask & FIELD_BITS[field]:
+                continue
+            field_struct = FIELD_STRUCTS[field]
+            if field_struct is None:
+                fields[field], offset = read_string(body, offset)
+                continue
+            values = field_struct.unpack_from(body, offset)
+            offset += field_struct.size
+            fields[field] = list(values) if len(fmt) > 1 else values[0]
+        changed[player_name] = fields
+
+    return StatsMessage(version=version, base=base, changed=changed, removed=removed)
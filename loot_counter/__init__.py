@@ -183,11 +183,25 @@ BaseOptions.set_default(BaseOptions.WIDTH, 250)
 canv = drawing.Drawing(hidden_options=[BaseOptions.RHS_COLUMN_WIDTH])
 
 
+# the textures and fonts of the old world may be gone, look them up again
+@hook("WillowGame.WillowPlayerController:WillowClientDisableLoadingMovie")
+def on_world_loaded(_obj, _args, _ret, _func) -> None:
+    drawing.RESOURCES.clear()
+
+
 def draw_tracker(canvas: drawing.Canvas, name: str, data: RunData) -> None:
-    canv.reset_state(canvas)
-    canv.draw_background()
-    canv.reset_state(canvas)
-    canv.draw_background()
+    # the counts are changed in place, so the key needs copies of them
+    content_key = (
+        name,
+        data["runs"],
+        data["show_rarity"],
+        tuple(data["tracked_rarities"].items()),
+        tuple(data["tracked_items"].items()),
+    )
+    canv.draw_retained(canvas, content_key, lambda: draw_tracker_lines(name, data))
+
+
+def draw_tracker_lines(name: str, data: RunData) -> None:
     canv.draw_text_current_line("Farming: " + name, drawing.WHITE_COLOR)
     canv.new_line()
     canv.draw_text_current_line("Runs: " + str(data["runs"]), drawing.WHITE_COLOR)
@@ -1,10 +1,12 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Callable, Hashable, Sequence, cast
 from unrealsdk import find_object, make_struct
-from .options import FONTS, BaseOptions
+from unrealsdk.unreal import UObject, WeakPointer
+from .options import FONT_PATHS, BaseOptions, Layout
+from .text_metrics import TextMetrics
 
 if TYPE_CHECKING:
-    from bl2 import Canvas, Object
+    from bl2 import Canvas, Font, Object, Texture2D
 
     make_struct_color = Object.Color.make_struct
     make_struct_linear_color = Object.LinearColor.make_struct
@@ -49,6 +51,69 @@ FONT_RENDER_INFO = make_struct_font_render_info(
 )
 
 
+class ResourceCache:
+    """
+    Engine objects the overlays draw with, looked up once on first use and then kept as weak pointers.
+
+    Checking a weak pointer is much cheaper than looking the object up in the global object table again.
+    Objects that got garbage collected are looked up again on their next use, clear() drops everything,
+    e.g. once a new world finished loading.
+    """
+
+    __slots__ = ("pointers", "hits", "misses")
+
+    def __init__(self) -> None:
+        self.pointers: dict[tuple[str, str], WeakPointer] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, class_name: str, path: str) -> UObject:
+        key = (class_name, path)
+        pointer = self.pointers.get(key)
+        if pointer is not None:
+            obj = pointer()
+            if obj is not None:
+                self.hits += 1
+                return obj
+        self.misses += 1
+        obj = find_object(class_name, path)
+        self.pointers[key] = WeakPointer(obj)
+        return obj
+
+    def clear(self) -> None:
+        self.pointers.clear()
+
+    def font(self, name: str) -> Font:
+        return cast("Font", self.get("Font", FONT_PATHS[name]))
+
+    def white_square_texture(self) -> Texture2D:
+        return cast("Texture2D", self.get("Texture2D", "EngineResources.WhiteSquareTexture"))
+
+
+# shared by all panels of the mod
+RESOURCES = ResourceCache()
+
+
+# kinds of the commands in a display list
+# (TEXT, x, y, text, color), (RECT, x, y, width, height, color), (LINE, x1, y1, x2, y2, color)
+TEXT = 0
+RECT = 1
+LINE = 2
+# a rect whose height is only known once the panel is recorded, (BACKGROUND, x, y, width, color)
+BACKGROUND = 3
+
+
+class DisplayList:
+    """Draw commands of a panel with resolved coordinates, colors and strings"""
+
+    __slots__ = ("commands", "content_key", "layout_key")
+
+    def __init__(self, content_key: Hashable = None, layout_key: Hashable = None) -> None:
+        self.commands: list[tuple[Any, ...]] = []
+        self.content_key = content_key
+        self.layout_key = layout_key
+
+
 # region Drawing Class
 class Drawing:
     def __init__(
@@ -56,6 +121,7 @@ class Drawing:
         *,
         options: type[BaseOptions] = BaseOptions,
         hidden_options: list[str] = [],
+        glyph_advances: bool = False,
     ) -> None:
         self.options = options
         self.opt_group = options.create_group(
@@ -69,29 +135,51 @@ class Drawing:
         self.max_lines: int = 0
 
         self.text_height: int = 0
+        # glyph_advances computes the width of new strings from the widths of their characters
+        self.text_metrics = TextMetrics(glyph_advances=glyph_advances)
 
         self.bg_padding_x: int = 10
         self.bg_padding_y: int = 5
 
+        # retained mode, draw calls go into the display list while recording it
+        self.display_list: DisplayList | None = None
+        self.recording: DisplayList | None = None
+
+        # only resolved again once a layout option or the canvas size changed
+        self.layout: Layout = options.resolve_layout(self.screen_width, self.screen_height)
+        self.layout_version = -1
+        # number of lines the max value of the y position slider was last set for
+        self.y_limit_lines = -1
+
     # has to be called every frame for other functions to work (weird setup, but alas)
     def reset_state(self, canvas: Canvas) -> None:
-        opts = self.options
         self.canvas = canvas
-        self.canvas.Font = FONTS[opts.get_spinner(opts.FONT).value]
-
-        opts.get_slider(opts.X_POS).max_value = canvas.SizeX - opts.get_slider(opts.WIDTH).value
-        opts.get_slider(opts.Y_POS).max_value = (
-            canvas.SizeY - opts.get_slider(opts.LINE_HEIGHT).value * self.running_num_lines
-        )
+        self.canvas.Font = RESOURCES.font(self.update_layout(canvas).font)
 
         # update the max width/lines of the last frame
         self.max_lines = self.running_num_lines
         self.running_num_lines = 0
 
+    def update_layout(self, canvas: Canvas) -> Layout:
+        layout = self.layout
+        opts = self.options
+        if (
+            self.layout_version != opts.layout_version
+            or layout.canvas_width != canvas.SizeX
+            or layout.canvas_height != canvas.SizeY
+        ):
+            layout = self.layout = opts.resolve_layout(canvas.SizeX, canvas.SizeY)
+            self.layout_version = opts.layout_version
+            self.y_limit_lines = -1
+            opts.get_slider(opts.X_POS).max_value = canvas.SizeX - layout.width
+        if self.y_limit_lines != self.running_num_lines:
+            self.y_limit_lines = self.running_num_lines
+            opts.get_slider(opts.Y_POS).max_value = canvas.SizeY - layout.line_height * self.running_num_lines
+        return layout
+
     def get_text_size(self, text: str) -> tuple[int, int]:
-        values = self.canvas.TextSize(text, 0, 0)
-        # SUPER hacky but SOMETIMES the return value is just (float, float) without an ellipsis at the start
-        return (values[-2], values[-1])
+        # cached per font, changing the font option drops everything measured with the old one
+        return self.text_metrics.size(self.canvas, self.layout.font, text)
 
     def draw_text(
         self,
@@ -105,6 +193,9 @@ class Drawing:
         width, height = self.get_text_size(text)
         self.text_height = height
 
+        if self.recording is not None:
+            self.recording.commands.append((TEXT, x, y, text, color))
+            return
         self.canvas.SetPos(x, y)
         self.canvas.SetDrawColorStruct(color)
         self.canvas.DrawText(text, True, 1, 1, FONT_RENDER_INFO)
@@ -115,15 +206,13 @@ class Drawing:
 
         To get increase the line count and get into a new line call new_line().
         """
-        opts = self.options
-        centered_offset = opts.get_slider(opts.LINE_HEIGHT).value // 2 - self.text_height // 2 if centered else 0
+        layout = self.layout
+        centered_offset = layout.line_height // 2 - self.text_height // 2 if centered else 0
         self.draw_text(
             text=text,
             color=color,
-            x=opts.get_slider(opts.X_POS).value,
-            y=opts.get_slider(opts.Y_POS).value
-            + self.running_num_lines * opts.get_slider(opts.LINE_HEIGHT).value
-            + centered_offset,
+            x=layout.x,
+            y=layout.y + self.running_num_lines * layout.line_height + centered_offset,
         )
 
     def draw_text_rhs_column(
@@ -135,51 +224,70 @@ class Drawing:
         A value of 0 for position_from_right means the rightmost column.
         Cendered specifies whether to vertically center the text.
         """
-        opts = self.options
-        centered_offset = opts.get_slider(opts.LINE_HEIGHT).value // 2 - self.text_height // 2 if centered else 0
+        layout = self.layout
+        centered_offset = layout.line_height // 2 - self.text_height // 2 if centered else 0
         self.draw_text(
             text=text,
             color=color,
-            x=opts.get_slider(opts.X_POS).value
-            + opts.get_slider(opts.WIDTH).value
-            - opts.get_slider(opts.RHS_COLUMN_WIDTH).value * (position_from_right + 1),
-            y=opts.get_slider(opts.Y_POS).value
-            + self.running_num_lines * opts.get_slider(opts.LINE_HEIGHT).value
-            + centered_offset,
+            x=layout.x + layout.width - layout.column_width * (position_from_right + 1),
+            y=layout.y + self.running_num_lines * layout.line_height + centered_offset,
         )
 
-    def new_line(
-        self,
-    ) -> None:
+    def new_line(self, count: int = 1) -> None:
         """Moves the current line down by the line height"""
-        self.running_num_lines += 1
+        self.running_num_lines += count
 
     def draw_rectangle(self, x: int, y: int, width: int, height: int, color: Object.Color) -> None:
         """Draws a rectangle at the given position with the given size and color"""
+        if self.recording is not None:
+            self.recording.commands.append((RECT, x, y, width, height, color))
+            return
         self.canvas.SetPos(x, y)
         self.canvas.SetDrawColorStruct(color)
-        tex = find_object("Texture2D", "EngineResources.WhiteSquareTexture")
-        self.canvas.DrawRect(width, height, tex)
+        self.canvas.DrawRect(width, height, RESOURCES.white_square_texture())
+
+    def draw_line(self, x1: float, y1: float, x2: float, y2: float, color: Object.Color) -> None:
+        """Draws a one pixel wide line between the two given points"""
+        if self.recording is not None:
+            self.recording.commands.append((LINE, x1, y1, x2, y2, color))
+            return
+        self.canvas.Draw2DLine(x1, y1, x2, y2, color)
+
+    def draw_graph(self, points: Sequence[tuple[float, float]], color: Object.Color, num_lines: int) -> None:
+        """
+        Draws the points as connected lines over the current and the following lines.
+
+        Both coordinates of the points have to be between 0 and 1, with y = 0 being the bottom of the graph.
+        Call new_line(num_lines) afterwards to move below the graph.
+        """
+        layout = self.layout
+        line_height = layout.line_height
+        x = layout.x
+        width = layout.width
+        bottom = layout.y + (self.running_num_lines + num_lines) * line_height
+        height = num_lines * line_height
+        for (x1, y1), (x2, y2) in zip(points, points[1:]):
+            self.draw_line(x + x1 * width, bottom - y1 * height, x + x2 * width, bottom - y2 * height, color)
 
     def draw_bar(self, percent: float, color: Object.Color) -> None:
         """Draws a bar at the current line, that is exactly one line tall and fills horizantally to the given percentage with the given color"""
-        opts = self.options
+        layout = self.layout
         self.draw_rectangle(
-            x=opts.get_slider(opts.X_POS).value - self.bg_padding_x,
-            y=opts.get_slider(opts.Y_POS).value + self.running_num_lines * opts.get_slider(opts.LINE_HEIGHT).value,
-            width=int(percent * (opts.get_slider(opts.WIDTH).value + self.bg_padding_x * 2)),
-            height=opts.get_slider(opts.LINE_HEIGHT).value,
+            x=layout.x - self.bg_padding_x,
+            y=layout.y + self.running_num_lines * layout.line_height,
+            width=int(percent * (layout.width + self.bg_padding_x * 2)),
+            height=layout.line_height,
             color=color,
         )
 
     def draw_hline_top(self, color: Object.Color, thickness: int = 1) -> None:
         """Draws a small horizontal line at the top of the current line with the given color"""
 
-        opts = self.options
+        layout = self.layout
         self.draw_rectangle(
-            x=opts.get_slider(opts.X_POS).value - self.bg_padding_x,
-            y=opts.get_slider(opts.Y_POS).value + self.running_num_lines * opts.get_slider(opts.LINE_HEIGHT).value,
-            width=opts.get_slider(opts.WIDTH).value + self.bg_padding_x * 2,
+            x=layout.x - self.bg_padding_x,
+            y=layout.y + self.running_num_lines * layout.line_height,
+            width=layout.width + self.bg_padding_x * 2,
             height=thickness,
             color=color,
         )
@@ -188,12 +296,80 @@ class Drawing:
         """Draws the background of the meter with the given color"""
         if self.canvas is None:
             return
-        opts = self.options
-        color.A = opts.get_slider(opts.BG_OPACITY).value
+        layout = self.layout
+        color.A = layout.opacity
+        if self.recording is not None:
+            # the height is filled in once all lines are recorded
+            self.recording.commands.append(
+                (
+                    BACKGROUND,
+                    layout.x - self.bg_padding_x,
+                    layout.y - self.bg_padding_y,
+                    layout.width + self.bg_padding_x * 2,
+                    color,
+                )
+            )
+            return
         self.draw_rectangle(
-            x=opts.get_slider(opts.X_POS).value - self.bg_padding_x,
-            y=opts.get_slider(opts.Y_POS).value - self.bg_padding_y,
-            width=opts.get_slider(opts.WIDTH).value + self.bg_padding_x * 2,
-            height=self.max_lines * opts.get_slider(opts.LINE_HEIGHT).value + self.bg_padding_y,
+            x=layout.x - self.bg_padding_x,
+            y=layout.y - self.bg_padding_y,
+            width=layout.width + self.bg_padding_x * 2,
+            height=self.max_lines * layout.line_height + self.bg_padding_y,
             color=color,
         )
+
+    def draw_retained(self, canvas: Canvas, content_key: Hashable, draw: Callable[[], None]) -> None:
+        """
+        Draws a panel in retained mode, instead of calling reset_state and draw_background every frame.
+
+        draw issues the usual draw calls, which get recorded into a display list with all positions resolved.
+        The list is replayed every frame and only recorded again once content_key or the layout options change,
+        so content_key has to cover everything draw shows.
+        """
+        # a new layout object means some layout option or the canvas size changed
+        layout_key = self.update_layout(canvas)
+        display_list = self.display_list
+        if display_list is None or display_list.content_key != content_key or display_list.layout_key != layout_key:
+            display_list = self.display_list = self.record(canvas, content_key, layout_key, draw)
+        self.replay(canvas, display_list)
+
+    def record(
+        self, canvas: Canvas, content_key: Hashable, layout_key: Hashable, draw: Callable[[], None]
+    ) -> DisplayList:
+        self.reset_state(canvas)
+        # lines get centered using the height of the text drawn before, which is stale after a font change
+        self.text_height = self.get_text_size("A")[1]
+        display_list = self.recording = DisplayList(content_key, layout_key)
+        try:
+            self.draw_background()
+            draw()
+        finally:
+            self.recording = None
+        self.max_lines = self.running_num_lines
+
+        height = self.running_num_lines * self.layout.line_height + self.bg_padding_y
+        display_list.commands = [
+            (RECT, *command[1:4], height, command[4]) if command[0] == BACKGROUND else command
+            for command in display_list.commands
+        ]
+        return display_list
+
+    def replay(self, canvas: Canvas, display_list: DisplayList) -> None:
+        self.canvas = canvas
+        canvas.Font = RESOURCES.font(self.layout.font)
+        texture = RESOURCES.white_square_texture()
+        for command in display_list.commands:
+            kind = command[0]
+            if kind == TEXT:
+                _, x, y, text, color = command
+                canvas.SetPos(x, y)
+                canvas.SetDrawColorStruct(color)
+                canvas.DrawText(text, True, 1, 1, FONT_RENDER_INFO)
+            elif kind == RECT:
+                _, x, y, width, height, color = command
+                canvas.SetPos(x, y)
+                canvas.SetDrawColorStruct(color)
+                canvas.DrawRect(width, height, texture)
+            else:
+                _, x1, y1, x2, y2, color = command
+                canvas.Draw2DLine(x1, y1, x2, y2, color)
@@ -1,21 +1,23 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING, Any, Type, TypeVar, cast
-from unrealsdk import find_object
+from typing import Any, Type, TypeVar, cast
 from mods_base import options
 
-if TYPE_CHECKING:
-    from bl2 import Font
-
-
-FONTS: dict[str, Font] = {
+# paths of the Font objects, they are only looked up once drawn with, see drawing.ResourceCache
+FONT_PATHS: dict[str, str] = {
     # buggy
-    # "willowhead": cast("Font", find_object("Font", "UI_Fonts.Font_Willowhead_8pt")),
-    "willowbody": cast("Font", find_object("Font", "ui_fonts.font_willowbody_18pt")),
-    "hudmedium": cast("Font", find_object("Font", "UI_Fonts.Font_Hud_Medium")),
-    "smallfont": cast("Font", find_object("Font", "EngineFonts.SmallFont")),
-    "tinyfont": cast("Font", find_object("Font", "EngineFonts.TinyFont")),
+    # "willowhead": "UI_Fonts.Font_Willowhead_8pt",
+    "willowbody": "ui_fonts.font_willowbody_18pt",
+    "hudmedium": "UI_Fonts.Font_Hud_Medium",
+    "smallfont": "EngineFonts.SmallFont",
+    "tinyfont": "EngineFonts.TinyFont",
 }
 
+
+def on_layout_change(_option: options.BaseOption, _value: Any) -> None:
+    # called before the value changes, so only mark the resolved layouts as outdated
+    BaseOptions.layout_version += 1
+
+
 opt_show_example_ui = options.BoolOption(
     identifier="Show Example UI",
     value=False,
@@ -29,6 +31,7 @@ opt_bg_opacity = options.SliderOption(
     min_value=0,
     max_value=255,
     description="The opacity of the background",
+    on_change=on_layout_change,
 )
 opt_bg_opacity.default_value = 150
 
@@ -38,6 +41,7 @@ opt_x_pos = options.SliderOption(
     min_value=0,
     max_value=1920,
     description="The x position of the UI",
+    on_change=on_layout_change,
 )
 opt_x_pos.default_value = 35
 
@@ -47,6 +51,7 @@ opt_y_pos = options.SliderOption(
     min_value=0,
     max_value=1080,
     description="The y position of the UI",
+    on_change=on_layout_change,
 )
 opt_y_pos.default_value = 35
 
@@ -56,6 +61,7 @@ opt_width = options.SliderOption(
     min_value=10,
     max_value=1000,
     description="The width of the UI",
+    on_change=on_layout_change,
 )
 opt_width.default_value = 200
 
@@ -65,6 +71,7 @@ opt_line_height = options.SliderOption(
     min_value=10,
     max_value=200,
     description="The height of each line",
+    on_change=on_layout_change,
 )
 opt_line_height.default_value = 35
 
@@ -74,14 +81,16 @@ opt_rhs_column_width = options.SliderOption(
     min_value=10,
     max_value=200,
     description="The width of each column on the right-hand side in the UI",
+    on_change=on_layout_change,
 )
 opt_rhs_column_width.default_value = 70
 
 opt_font = options.SpinnerOption(
     identifier="Font",
     value="hudmedium",
-    choices=list(FONTS.keys()),
+    choices=list(FONT_PATHS.keys()),
     description="The font to use for the UI",
+    on_change=on_layout_change,
 )
 opt_font.default_value = "hudmedium"
 
@@ -89,6 +98,34 @@ opt_font.default_value = "hudmedium"
 T = TypeVar("T", bound=options.BaseOption)
 
 
+class Layout:
+    """The values of the layout options in plain attributes, resolved once instead of on every draw call"""
+
+    __slots__ = ("x", "y", "width", "line_height", "column_width", "opacity", "font", "canvas_width", "canvas_height")
+
+    def __init__(
+        self,
+        x: int,
+        y: int,
+        width: int,
+        line_height: int,
+        column_width: int,
+        opacity: int,
+        font: str,
+        canvas_width: int,
+        canvas_height: int,
+    ) -> None:
+        self.x = x
+        self.y = y
+        self.width = width
+        self.line_height = line_height
+        self.column_width = column_width
+        self.opacity = opacity
+        self.font = font
+        self.canvas_width = canvas_width
+        self.canvas_height = canvas_height
+
+
 class BaseOptions:
     SHOW_EXAMPLE_UI = "Show Example UI"
     BG_OPACITY = "Background Opacity"
@@ -99,6 +136,9 @@ class BaseOptions:
     RHS_COLUMN_WIDTH = "Right-Hand Side Columns Width"
     FONT = "Font"
 
+    # increased whenever a layout option changes, so resolved layouts know they are outdated
+    layout_version: int = 0
+
     _options: dict[str, options.BaseOption] = {
         SHOW_EXAMPLE_UI: opt_show_example_ui,
         BG_OPACITY: opt_bg_opacity,
@@ -146,6 +186,20 @@ class BaseOptions:
         opt.value = value
         opt.default_value = value
 
+    @classmethod
+    def resolve_layout(cls, canvas_width: int, canvas_height: int) -> Layout:
+        return Layout(
+            x=cls.get_slider(cls.X_POS).value,
+            y=cls.get_slider(cls.Y_POS).value,
+            width=cls.get_slider(cls.WIDTH).value,
+            line_height=cls.get_slider(cls.LINE_HEIGHT).value,
+            column_width=cls.get_slider(cls.RHS_COLUMN_WIDTH).value,
+            opacity=cls.get_slider(cls.BG_OPACITY).value,
+            font=cls.get_spinner(cls.FONT).value,
+            canvas_width=canvas_width,
+            canvas_height=canvas_height,
+        )
+
     @classmethod
     def all_options(cls) -> dict[str, options.BaseOption]:
         return cls._options.copy()
@@ -0,0 +1,77 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from bl2 import Canvas
+
+DEFAULT_CACHE_SIZE = 512
+
+
+def measure_text(canvas: Canvas, text: str) -> tuple[float, float]:
+    values = canvas.TextSize(text, 0, 0)
+    # SUPER hacky but SOMETIMES the return value is just (float, float) without an ellipsis at the start
+    return (values[-2], values[-1])
+
+
+class TextMetrics:
+    """
+    Sizes of drawn strings, so the engine only gets asked once per font and string.
+
+    Measurements are kept in an LRU cache keyed by (font, string). With glyph advances enabled, new strings are not
+    measured by the engine at all, instead the widths of their characters get added up, each character is only
+    measured once per font. That ignores kerning, which the fonts of the game barely use.
+    Everything measured with a font gets dropped once a different font is used.
+    """
+
+    __slots__ = ("max_size", "glyph_advances", "font", "sizes", "advances", "line_height", "hits", "misses")
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE, glyph_advances: bool = False) -> None:
+        self.max_size = max_size
+        self.glyph_advances = glyph_advances
+        self.font: str | None = None
+        self.sizes: OrderedDict[tuple[str, str], tuple[float, float]] = OrderedDict()
+        # width of every character measured so far and the height of a line, for the current font
+        self.advances: dict[str, float] = {}
+        self.line_height = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self) -> None:
+        self.sizes.clear()
+        self.advances.clear()
+        self.line_height = 0.0
+
+    def size(self, canvas: Canvas, font: str, text: str) -> tuple[float, float]:
+        """Width and height of the text, the canvas has to be set to the font already"""
+        if font != self.font:
+            self.clear()
+            self.font = font
+
+        key = (font, text)
+        size = self.sizes.get(key)
+        if size is not None:
+            self.sizes.move_to_end(key)
+            self.hits += 1
+            return size
+
+        self.misses += 1
+        size = self._size_from_advances(canvas, text) if self.glyph_advances else measure_text(canvas, text)
+        self.sizes[key] = size
+        if len(self.sizes) > self.max_size:
+            self.sizes.popitem(last=False)
+        return size
+
+    def _size_from_advances(self, canvas: Canvas, text: str) -> tuple[float, float]:
+        advances = self.advances
+        width = 0.0
+        for character in text:
+            advance = advances.get(character)
+            if advance is None:
+                advance, height = measure_text(canvas, character)
+                advances[character] = advance
+                self.line_height = max(self.line_height, height)
+            width += advance
+        if self.line_height == 0:
+            self.line_height = measure_text(canvas, " ")[1]
+        return (width, self.line_height)